@@ -1,239 +1,373 @@
-import csv
 import os
-
-from dotenv import load_dotenv
+from contextlib import ExitStack
+from functools import partial
 
 from config import (
+    CACHE_MAX_ENTRIES,
+    CACHE_TTL_SECONDS,
+    CRAWL_DEPTH,
+    CRAWL_MATCHES_PER_PLAYER,
+    CRAWL_MAX_PLAYERS,
     CSV_DIR,
     DATA_DIR,
+    DDRAGON_DIR,
+    DDRAGON_LOCALE,
+    DDRAGON_VERSIONS_TTL_SECONDS,
+    FRAME_STORE_DIR,
+    HEATMAP_STATE_PATH,
+    MAX_IN_FLIGHT_MATCHES,
+    METRICS_JSON_PATH,
+    METRICS_PROM_PATH,
+    RAW_FORMAT,
+    RIOT_API_BASE_URL,
     RIOT_ID_GAME_NAME,
     RIOT_ID_TAG_LINE,
+    RIOT_IDS,
+    RIOT_MAX_WORKERS,
     RIOT_PLATFORM_ROUTING,
     RIOT_REGIONAL_ROUTING,
+    ROLLUP_STATE_PATH,
+    RUN_CHECKPOINT_MATCHES,
+    RUN_JOURNAL_DIR,
+    SQLITE_PATH,
+    WATERMARK_PATH,
 )
-from csv_exporter import flatten_dict, write_csv, write_data_as_csv
-from ddragon import fetch_champion_dimension
-from riot import (
-    RiotClient,
-    get_account_by_riot_id,
-    get_champion_mastery_by_puuid,
-    get_league_entries_by_summoner_id,
-    get_match,
-    get_match_ids_by_puuid,
-    get_match_timeline,
-    get_summoner_by_puuid,
-)
+from crawler import MatchCrawler, parse_riot_ids
+from csv_exporter import write_csv, write_data_as_csv
+from ddragon import DataDragon
+from frame_store import FrameStore, extract_frames
+from heatmaps import HeatmapStore
+from metrics import Metrics
+from response_cache import ResponseCache
+from riot import RiotClient, fetch_many
+from rollups import RollupStore
+from run_journal import RunJournal
+from sqlite_store import SqliteStore
 from storage import write_json
-from time_utils import add_datetime_fields, format_unix_ms
-from timeline_processing import (
-    build_fact_match_timeline_rows,
-    build_timeline_frame_rows,
-)
+from sinks import TableSink, published_rows
+from time_utils import add_datetime_fields, add_datetime_fields_batch
+from timeline_processing import SpatialEventAggregator, process_timeline
+from transform import MATCH_CHILD_TABLES, TIMELINE_TABLES, transform_match
+from watermarks import WatermarkStore
 
 
-def _upsert_fact_match_player(
-    path: str, rows: list[dict], allowed_queues: set[int] | None = None
-) -> None:
-    if not rows:
-        return
-    directory = os.path.dirname(path)
-    if directory:
-        os.makedirs(directory, exist_ok=True)
-
-    existing_rows: list[dict] = []
-    existing_keys: set[tuple[str, str]] = set()
-    if os.path.exists(path):
-        with open(path, "r", newline="", encoding="utf-8") as handle:
-            reader = csv.DictReader(handle)
-            for row in reader:
-                key = (row.get("match_id", ""), row.get("puuid", ""))
-                existing_keys.add(key)
-            if allowed_queues is None:
-                existing_rows.append(row)
-            else:
-                queue_id = row.get("queue_id")
-                try:
-                    queue_id_int = int(queue_id) if queue_id not in (None, "") else None
-                except (TypeError, ValueError):
-                    queue_id_int = None
-                if queue_id_int in allowed_queues:
-                    existing_rows.append(row)
-
-    for row in rows:
-        if allowed_queues is not None:
-            queue_id = row.get("queue_id")
-            if queue_id not in allowed_queues:
-                continue
-        key = (str(row.get("match_id", "")), str(row.get("puuid", "")))
-        if key in existing_keys:
-            continue
-        existing_keys.add(key)
-        existing_rows.append(row)
-
-    fieldnames = sorted({key for row in existing_rows for key in row.keys()})
-    with open(path, "w", newline="", encoding="utf-8") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in existing_rows:
-            writer.writerow(row)
-
-
-def _get_ranked_match_ids(
-    client: RiotClient,
-    puuid: str,
-    queues: list[int],
-    desired: int,
-    batch: int = 20,
-) -> list[str]:
-    match_ids: list[str] = []
-    seen: set[str] = set()
-    start = 0
-    while len(match_ids) < desired:
-        before_len = len(match_ids)
-        for queue_id in queues:
-            ids = get_match_ids_by_puuid(
-                client, puuid, count=batch, start=start, queue=queue_id
-            )
-            for match_id in ids:
-                if match_id in seen:
-                    continue
-                seen.add(match_id)
-                match_ids.append(match_id)
-        if len(match_ids) == before_len:
-            break
-        start += batch
-    return match_ids
+def _in_queues(allowed_queues: set[int], row: dict) -> bool:
+    # Existing CSV rows carry queue_id as text, fresh rows as int.
+    queue_id = row.get("queue_id")
+    try:
+        queue_id_int = int(queue_id) if queue_id not in (None, "") else None
+    except (TypeError, ValueError):
+        queue_id_int = None
+    return queue_id_int in allowed_queues
 
 
-def main() -> None:
-    load_dotenv(".env")
-    api_key = os.getenv("RIOT_API_KEY", "").strip()
-    client = RiotClient(
-        api_key=api_key,
-        platform_routing=RIOT_PLATFORM_ROUTING,
-        regional_routing=RIOT_REGIONAL_ROUTING,
+def _fetch_match(cache: ResponseCache, client: RiotClient, match_id: str) -> tuple:
+    # Reads back from the raw archive when the crawler already fetched the match.
+    return cache.match(client, match_id), cache.timeline(client, match_id)
+
+
+def _match_events(
+    cache: ResponseCache, client: RiotClient, match_id: str
+) -> list[dict]:
+    match, timeline = _fetch_match(cache, client, match_id)
+    aggregator = SpatialEventAggregator(
+        match_id, match.get("info", {}).get("participants", [])
     )
+    frames = timeline.get("info", {}).get("frames", [])
+    return process_timeline(frames, [aggregator])[aggregator.table]
+
 
-    account = get_account_by_riot_id(client, RIOT_ID_GAME_NAME, RIOT_ID_TAG_LINE)
+def _checkpoint(cache: ResponseCache, journal: RunJournal, unsaved: list) -> None:
+    # Saving the cache makes the raw payloads fetched since the last checkpoint
+    # durable (pack archives only index their records on flush).
+    cache.save()
+    for match_id in unsaved:
+        journal.mark(match_id, "raw")
+    unsaved.clear()
+
+
+def _fetch_profile(
+    client: RiotClient, cache: ResponseCache, game_name: str, tag_line: str
+) -> tuple[dict, dict, list, list]:
+    account = cache.account(client, game_name, tag_line)
     puuid = account["puuid"]
-    summoner = get_summoner_by_puuid(client, puuid)
-    ranked_queues = [420, 440]
-    desired_match_count = 20
-    match_ids = _get_ranked_match_ids(
-        client, puuid, ranked_queues, desired=desired_match_count
-    )
+    summoner = cache.summoner(client, puuid)
     summoner_id = summoner.get("id")
     league_entries = []
     if summoner_id:
-        league_entries = get_league_entries_by_summoner_id(client, summoner_id)
+        league_entries = cache.league_entries(client, summoner_id)
     else:
-        print("Warning: summoner 'id' missing; skipping league entries.")
-    champion_mastery = get_champion_mastery_by_puuid(client, puuid)
+        print(
+            f"Warning: summoner 'id' missing for {game_name}#{tag_line}; "
+            "skipping league entries."
+        )
+    champion_mastery = cache.champion_mastery(client, puuid)
     add_datetime_fields(summoner, "revisionDate", summoner.get("revisionDate"))
-    for mastery in champion_mastery:
-        add_datetime_fields(mastery, "lastPlayTime", mastery.get("lastPlayTime"))
+    add_datetime_fields_batch(champion_mastery, "lastPlayTime")
+    return account, summoner, league_entries, champion_mastery
+
 
-    write_json(os.path.join(DATA_DIR, "account.json"), account)
-    write_json(os.path.join(DATA_DIR, "summoner.json"), summoner)
+def main() -> None:
+    api_key = os.getenv("RIOT_API_KEY", "").strip()
+    metrics = Metrics()
+    client = RiotClient(
+        api_key=api_key,
+        platform_routing=RIOT_PLATFORM_ROUTING,
+        regional_routing=RIOT_REGIONAL_ROUTING,
+        metrics=metrics,
+        base_url=RIOT_API_BASE_URL,
+    )
+    cache = ResponseCache(
+        DATA_DIR,
+        max_entries=CACHE_MAX_ENTRIES,
+        ttl_seconds=CACHE_TTL_SECONDS,
+        raw_format=RAW_FORMAT,
+    )
+
+    riot_ids = parse_riot_ids(RIOT_IDS) or [(RIOT_ID_GAME_NAME, RIOT_ID_TAG_LINE)]
+    with metrics.stage("profiles"):
+        profiles = [
+            _fetch_profile(client, cache, game_name, tag_line)
+            for game_name, tag_line in riot_ids
+        ]
+    accounts = [profile[0] for profile in profiles]
+    summoners = [profile[1] for profile in profiles]
+    league_entries = [entry for profile in profiles for entry in profile[2]]
+    champion_mastery = [row for profile in profiles for row in profile[3]]
+
+    # A single tracked account keeps the original one-object JSON layout.
+    single = len(profiles) == 1
+    write_json(
+        os.path.join(DATA_DIR, "account.json"), accounts[0] if single else accounts
+    )
+    write_json(
+        os.path.join(DATA_DIR, "summoner.json"), summoners[0] if single else summoners
+    )
     write_json(os.path.join(DATA_DIR, "league_entries.json"), league_entries)
     write_json(os.path.join(DATA_DIR, "champion_mastery.json"), champion_mastery)
 
-    write_data_as_csv(os.path.join(CSV_DIR, "account.csv"), account)
-    write_data_as_csv(os.path.join(CSV_DIR, "summoner.csv"), summoner)
+    write_data_as_csv(os.path.join(CSV_DIR, "account.csv"), accounts)
+    write_data_as_csv(os.path.join(CSV_DIR, "summoner.csv"), summoners)
     write_data_as_csv(os.path.join(CSV_DIR, "league_entries.csv"), league_entries)
     write_data_as_csv(os.path.join(CSV_DIR, "champion_mastery.csv"), champion_mastery)
-    champion_dimension = fetch_champion_dimension()
-    write_csv(os.path.join(CSV_DIR, "dim_champion.csv"), champion_dimension)
 
-    match_rows = []
-    timeline_rows = []
-    fact_match_player_rows = []
-    fact_match_timeline_rows = []
     allowed_queues = {420, 440}
-    ranked_matches: list[tuple[str, dict, dict]] = []
-    for match_id in match_ids:
-        match = get_match(client, match_id)
-        info = match.get("info", {})
-        if info.get("queueId") not in allowed_queues:
-            continue
-        ranked_matches.append((match_id, match, info))
-
-    ranked_matches.sort(
-        key=lambda item: item[2].get("gameStartTimestamp") or 0, reverse=True
+    watermarks = WatermarkStore(WATERMARK_PATH)
+    crawler = MatchCrawler(
+        client,
+        cache,
+        queues=[420, 440],
+        matches_per_player=CRAWL_MATCHES_PER_PLAYER,
+        max_depth=CRAWL_DEPTH,
+        max_players=CRAWL_MAX_PLAYERS,
+        max_workers=RIOT_MAX_WORKERS,
+        watermarks=watermarks,
     )
-    ranked_matches = ranked_matches[:desired_match_count]
-    match_ids = [match_id for match_id, _, _ in ranked_matches]
+    with metrics.stage("discovery"):
+        ranked_matches = crawler.crawl([account["puuid"] for account in accounts])
+    metrics.add_rows("discovery", len(ranked_matches))
+    match_ids = [match_id for match_id, _ in ranked_matches]
 
     write_json(os.path.join(DATA_DIR, "match_ids.json"), match_ids)
     write_data_as_csv(os.path.join(CSV_DIR, "match_ids.csv"), match_ids)
+    write_csv(
+        os.path.join(CSV_DIR, "dim_tracked_player.csv"),
+        (
+            {"puuid": puuid, "crawl_depth": depth}
+            for puuid, depth in crawler.tracked.items()
+        ),
+        fieldnames=["puuid", "crawl_depth"],
+    )
 
-    for match_id, match, info in ranked_matches:
-        timeline = get_match_timeline(client, match_id)
-        write_json(os.path.join(DATA_DIR, "matches", f"{match_id}.json"), match)
-        write_json(
-            os.path.join(DATA_DIR, "match_timelines", f"{match_id}.json"), timeline
+    # Static dimensions for every patch in the selection, joined per match on
+    # fact_match_player.ddragon_version.
+    with metrics.stage("dimensions"):
+        ddragon = DataDragon(
+            DDRAGON_DIR,
+            locale=DDRAGON_LOCALE,
+            versions_ttl=DDRAGON_VERSIONS_TTL_SECONDS,
         )
-
-        match_start_ts = info.get("gameStartTimestamp")
-        match_row = flatten_dict(match)
-        match_row["matchId"] = match_id
-        add_datetime_fields(match_row, "info.gameCreation", info.get("gameCreation"))
-        add_datetime_fields(
-            match_row, "info.gameStartTimestamp", info.get("gameStartTimestamp")
+        ddragon_versions = {
+            match_id: ddragon.resolve(meta.get("gameVersion") or "")
+            for match_id, meta in ranked_matches
+        }
+        # fact_match_player accumulates across runs, so its dimensions cover every
+        # release earlier runs downloaded, not just this run's.
+        dimensions = ddragon.dimensions(
+            [
+                ddragon.latest(),
+                *ddragon_versions.values(),
+                *ddragon.downloaded_versions(),
+            ]
         )
-        match_rows.append(match_row)
+        for table, rows in dimensions.items():
+            write_csv(os.path.join(CSV_DIR, f"{table}.csv"), rows)
+            metrics.add_rows("dimensions", len(rows), table)
 
-        frames = timeline.get("info", {}).get("frames", [])
-        timeline_rows.extend(build_timeline_frame_rows(match_id, frames, match_start_ts))
-        fact_match_timeline_rows.extend(
-            build_fact_match_timeline_rows(match_id, frames, info.get("participants", []))
-        )
+    store = SqliteStore(SQLITE_PATH) if SQLITE_PATH else None
+    frame_store = FrameStore(FRAME_STORE_DIR) if FRAME_STORE_DIR else None
+    rollups = RollupStore(ROLLUP_STATE_PATH) if ROLLUP_STATE_PATH else None
+    heatmaps = (
+        HeatmapStore(HEATMAP_STATE_PATH, crawler.tracked)
+        if HEATMAP_STATE_PATH
+        else None
+    )
+    if store is not None:
+        for table, rows in dimensions.items():
+            store.load(table, rows, replace=True)
 
-        game_time = format_unix_ms(match_start_ts)
-        for participant in info.get("participants", []):
-            cs_total = participant.get("totalMinionsKilled", 0) + participant.get(
-                "neutralMinionsKilled", 0
+    # A run that stopped early left its journal behind: matches whose rows were
+    # spilled are read back instead of fetched and transformed again.
+    journal = RunJournal(RUN_JOURNAL_DIR)
+    pending = [match_id for match_id in match_ids if not journal.done(match_id)]
+    if journal.resumed:
+        print(
+            "Resuming the unfinished run: "
+            f"{len(match_ids) - len(pending)} of {len(match_ids)} matches already "
+            "processed."
+        )
+    # The rollup state records the run it was saved in, in the same write as the
+    # partials: if that is the run being resumed, its matches are counted there.
+    rollups_saved = rollups is not None and rollups.run == journal.run_id
+    if rollups is not None and not rollups.loaded:
+        # No saved state (rollups just enabled, or the file was lost): start from
+        # the fact_match_player rows already published, not from zero.
+        with metrics.stage("rollups"):
+            seeded = rollups.add(published_rows("fact_match_player"))
+        if seeded:
+            print(f"Rebuilt the rollups from {seeded} fact_match_player rows.")
+    new_players = heatmaps.new_players() if heatmaps is not None else set()
+    if heatmaps is not None and new_players:
+        # Players tracked for the first time get their share of the matches the
+        # grids already counted: fact_match_player lists the matches they played
+        # and the events are rebuilt from the raw archive, without API calls.
+        with metrics.stage("heatmaps"):
+            played = heatmaps.counted(
+                row["match_id"]
+                for row in published_rows("fact_match_player")
+                if row["puuid"] in new_players
             )
-            game_version = info.get("gameVersion", "")
-            fact_match_player_rows.append(
-                {
-                    "match_id": match_id,
-                    "puuid": participant.get("puuid"),
-                    "summoner_name": participant.get("summonerName"),
-                    "game_datetime": game_time["datetime_utc"],
-                    "game_datetime_utc": game_time["datetime_utc"],
-                    "game_datetime_brasil": game_time["datetime_brasil"],
-                    "patch": game_version[:5] if game_version else "",
-                    "queue_id": info.get("queueId"),
-                    "game_duration": info.get("gameDuration"),
-                    "win": 1 if participant.get("win") else 0,
-                    "championId": participant.get("championId"),
-                    "champion": participant.get("championName"),
-                    "lane": participant.get("lane"),
-                    "role": participant.get("teamPosition"),
-                    "kills": participant.get("kills"),
-                    "deaths": participant.get("deaths"),
-                    "assists": participant.get("assists"),
-                    "cs": cs_total,
-                    "gold": participant.get("goldEarned"),
-                    "vision_score": participant.get("visionScore"),
-                    "damage": participant.get("totalDamageDealtToChampions"),
-                }
+            backfilled = heatmaps.backfill(
+                (match_id, _match_events(cache, client, match_id))
+                for match_id in played
             )
+        if backfilled:
+            print(f"Backfilled the player heatmaps from {backfilled} events.")
 
-    write_csv(os.path.join(CSV_DIR, "matches.csv"), match_rows)
-    write_csv(os.path.join(CSV_DIR, "match_timelines.csv"), timeline_rows)
-    _upsert_fact_match_player(
-        os.path.join(CSV_DIR, "fact_match_player.csv"),
-        fact_match_player_rows,
-        allowed_queues=allowed_queues,
-    )
-    write_csv(
-        os.path.join(CSV_DIR, "fact_match_timeline_clean.csv"),
-        fact_match_timeline_rows,
+    # discover -> fetch (the cache persists raw payloads) -> transform -> spill ->
+    # sink, one match at a time: at most MAX_IN_FLIGHT_MATCHES payloads are held in
+    # memory and each match is dropped once its rows are written.
+    payloads = iter(
+        fetch_many(
+            client,
+            partial(_fetch_match, cache),
+            pending,
+            max_workers=RIOT_MAX_WORKERS,
+            max_in_flight=MAX_IN_FLIGHT_MATCHES,
+        )
     )
+    # Fetched since the last checkpoint, so not yet journaled as "raw".
+    unsaved: list[str] = []
+    with ExitStack() as stack:
+        stack.callback(journal.close)
+        # Also on failure, so an interrupted run keeps the payloads it fetched.
+        stack.callback(_checkpoint, cache, journal, unsaved)
+        sinks = {
+            "matches": stack.enter_context(TableSink("matches", "matchId", store)),
+            "fact_match_player": stack.enter_context(
+                TableSink(
+                    "fact_match_player",
+                    store=store,
+                    upsert_keys=("match_id", "puuid"),
+                    keep=partial(_in_queues, allowed_queues),
+                )
+            ),
+        }
+        for table in (*MATCH_CHILD_TABLES, *TIMELINE_TABLES):
+            sinks[table] = stack.enter_context(TableSink(table, store=store))
+        for match_id in match_ids:
+            resumed = journal.done(match_id)
+            if resumed:
+                with metrics.stage("journal"):
+                    datetime_utc, tables, frames = journal.load(match_id)
+            else:
+                with metrics.stage("fetch_matches"):
+                    _, (match, timeline) = next(payloads)
+                journal.mark(match_id, "fetched")
+                unsaved.append(match_id)
+                with metrics.stage("transform"):
+                    datetime_utc, tables = transform_match(
+                        match_id, match, timeline, ddragon_versions[match_id]
+                    )
+                frames = None
+                if frame_store is not None and match_id not in frame_store:
+                    with metrics.stage("frame_store"):
+                        frames = extract_frames(
+                            timeline.get("info", {}).get("frames", []),
+                            match.get("info", {}).get("participants", []),
+                        )
+                del match, timeline
+                with metrics.stage("journal"):
+                    journal.spill(match_id, (datetime_utc, tables, frames))
+                if len(unsaved) >= RUN_CHECKPOINT_MATCHES:
+                    with metrics.stage("journal"):
+                        _checkpoint(cache, journal, unsaved)
+            if (
+                frames is not None
+                and frame_store is not None
+                and match_id not in frame_store
+            ):
+                with metrics.stage("frame_store"):
+                    frame_store.add(match_id, frames)
+            with metrics.stage("write_tables"):
+                for table, rows in tables.items():
+                    written = sinks[table].write(rows, datetime_utc)
+                    # Only rows new to fact_match_player reach the rollups.
+                    if (
+                        table == "fact_match_player"
+                        and rollups is not None
+                        and not (resumed and rollups_saved)
+                    ):
+                        rollups.add(written)
+            # Matches (and match/player pairs) already in the grids are not
+            # counted again.
+            if heatmaps is not None:
+                with metrics.stage("heatmaps"):
+                    heatmaps.add(match_id, tables["fact_match_events"])
+            for table, rows in tables.items():
+                metrics.add_rows("transform", len(rows), table)
 
-    print(f"Saved {len(match_ids)} matches for {RIOT_ID_GAME_NAME}#{RIOT_ID_TAG_LINE}.")
+        # Commit: every table is staged in full first, then the frame store,
+        # rollups and heatmaps are saved, and only then are the staged CSVs
+        # renamed into place (on close), back to back.
+        with metrics.stage("write_tables"):
+            for sink in sinks.values():
+                sink.prepare()
+        if frame_store is not None:
+            frame_store.flush()
+        if rollups is not None:
+            with metrics.stage("rollups"):
+                rollups.export(CSV_DIR, store, run=journal.run_id)
+        if heatmaps is not None:
+            with metrics.stage("heatmaps"):
+                heatmaps.export(CSV_DIR, store)
+        with metrics.stage("write_tables"):
+            stack.close()
+    if store is not None:
+        store.close()
+    if heatmaps is not None:
+        heatmaps.close()
+    journal.commit()
+
+    # Advanced only after every output is written, so a failed run rediscovers.
+    watermarks.save()
+    print(f"API calls for cached endpoints: {cache.api_calls}.")
+    tracked = ", ".join(f"{game_name}#{tag_line}" for game_name, tag_line in riot_ids)
+    print(
+        f"Saved {len(match_ids)} matches for {tracked} "
+        f"({len(crawler.tracked)} tracked players)."
+    )
+    metrics.export(METRICS_JSON_PATH, METRICS_PROM_PATH)
 
 
 if __name__ == "__main__":
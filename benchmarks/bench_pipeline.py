@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import argparse
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from itertools import chain
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from api import _in_queues
+from benchmarks.synthetic import generate_match_pair
+from csv_exporter import UpsertCsvWriter, flatten_dict, write_csv
+from storage import read_json, write_json
+from time_utils import format_unix_ms, format_unix_ms_batch
+from timeline_processing import (
+    build_fact_match_timeline_rows,
+    build_timeline_frame_rows,
+    build_timeline_tables,
+)
+from transform import (
+    build_fact_match_player_rows,
+    build_match_child_rows,
+    build_match_row,
+)
+
+
+_DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+
+
+class _Workload:
+    # `size` matches drawn round-robin from a pool of distinct generated payloads,
+    # so 10k-match runs keep realistic data without holding 10k timelines.
+    def __init__(
+        self, pool: List[Tuple[Dict, Dict]], size: int, workdir: str
+    ) -> None:
+        self.pool = pool
+        self.size = size
+        self.workdir = workdir
+
+    def matches(self) -> Iterator[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+        for index in range(self.size):
+            match, timeline = self.pool[index % len(self.pool)]
+            yield f"BR1_{index}", match, timeline
+
+
+def _frames(timeline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return timeline["info"]["frames"]
+
+
+def _stage_flatten_dict(workload: _Workload) -> Callable[[], None]:
+    def run() -> None:
+        for _, match, _ in workload.matches():
+            flatten_dict(match)
+
+    return run
+
+
+def _stage_build_match_tables(workload: _Workload) -> Callable[[], None]:
+    def run() -> None:
+        for match_id, match, _ in workload.matches():
+            build_match_row(match_id, match)
+            build_match_child_rows(match_id, match["info"])
+
+    return run
+
+
+def _frame_timestamps(workload: _Workload) -> List[List[int]]:
+    return [
+        [
+            match["info"]["gameStartTimestamp"] + frame["timestamp"]
+            for frame in _frames(timeline)
+        ]
+        for match, timeline in workload.pool
+    ]
+
+
+def _stage_format_unix_ms(workload: _Workload) -> Callable[[], None]:
+    timestamps = _frame_timestamps(workload)
+
+    def run() -> None:
+        for index in range(workload.size):
+            for timestamp in timestamps[index % len(timestamps)]:
+                format_unix_ms(timestamp)
+
+    return run
+
+
+def _stage_format_unix_ms_batch(workload: _Workload) -> Callable[[], None]:
+    timestamps = _frame_timestamps(workload)
+
+    def run() -> None:
+        for index in range(workload.size):
+            format_unix_ms_batch(timestamps[index % len(timestamps)])
+
+    return run
+
+
+def _stage_timeline_frame_rows(workload: _Workload) -> Callable[[], None]:
+    def run() -> None:
+        for match_id, match, timeline in workload.matches():
+            build_timeline_frame_rows(
+                match_id, _frames(timeline), match["info"]["gameStartTimestamp"]
+            )
+
+    return run
+
+
+def _stage_fact_match_timeline_rows(workload: _Workload) -> Callable[[], None]:
+    def run() -> None:
+        for match_id, match, timeline in workload.matches():
+            build_fact_match_timeline_rows(
+                match_id, _frames(timeline), match["info"]["participants"]
+            )
+
+    return run
+
+
+def _stage_timeline_tables(workload: _Workload) -> Callable[[], None]:
+    def run() -> None:
+        for match_id, match, timeline in workload.matches():
+            info = match["info"]
+            build_timeline_tables(
+                match_id,
+                _frames(timeline),
+                info["participants"],
+                info["gameStartTimestamp"],
+            )
+
+    return run
+
+
+def _stage_write_csv(workload: _Workload) -> Callable[[], None]:
+    pool_rows = [
+        build_timeline_frame_rows(
+            "BR1_0", _frames(timeline), match["info"]["gameStartTimestamp"]
+        )
+        for match, timeline in workload.pool
+    ]
+    path = os.path.join(workload.workdir, "match_timelines.csv")
+
+    def run() -> None:
+        write_csv(
+            path,
+            chain.from_iterable(
+                pool_rows[index % len(pool_rows)] for index in range(workload.size)
+            ),
+        )
+
+    return run
+
+
+def _upsert(path: str, matches: List[List[Dict[str, Any]]]) -> None:
+    # The fact_match_player sink: upsert on (match_id, puuid), ranked queues only,
+    # one write per match.
+    keep = partial(_in_queues, {420, 440})
+    with UpsertCsvWriter(path, ("match_id", "puuid"), keep=keep) as writer:
+        for rows in matches:
+            writer.writerows(rows)
+
+
+def _stage_upsert_fact_match_player(workload: _Workload) -> Callable[[], None]:
+    # Re-run shape: half the matches are already in the CSV, the rest are new.
+    matches: List[List[Dict[str, Any]]] = []
+    for match_id, match, _ in workload.matches():
+        info = match["info"]
+        matches.append(
+            build_fact_match_player_rows(
+                match_id, info, format_unix_ms(info["gameStartTimestamp"])
+            )
+        )
+    path = os.path.join(workload.workdir, "fact_match_player.csv")
+    if os.path.exists(path):
+        os.remove(path)
+    _upsert(path, matches[: len(matches) // 2])
+
+    def run() -> None:
+        _upsert(path, matches)
+
+    return run
+
+
+_STAGES: Dict[str, Callable[[_Workload], Callable[[], None]]] = {
+    "flatten_dict": _stage_flatten_dict,
+    "build_match_tables": _stage_build_match_tables,
+    "format_unix_ms": _stage_format_unix_ms,
+    "format_unix_ms_batch": _stage_format_unix_ms_batch,
+    "build_timeline_frame_rows": _stage_timeline_frame_rows,
+    "build_fact_match_timeline_rows": _stage_fact_match_timeline_rows,
+    "build_timeline_tables": _stage_timeline_tables,
+    "write_csv": _stage_write_csv,
+    "upsert_fact_match_player": _stage_upsert_fact_match_player,
+}
+
+
+def _measure(
+    stage: Callable[[_Workload], Callable[[], None]], workload: _Workload, memory: bool
+) -> Tuple[float, int | None]:
+    # Stage setup (payload prep, seeding files) runs outside the measured call.
+    run = stage(workload)
+    started = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - started
+    if not memory:
+        return seconds, None
+    # Separate pass: tracemalloc slows allocation-heavy code several times over.
+    run = stage(workload)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def _compare(
+    results: Dict[str, Dict[str, Dict[str, Any]]],
+    baseline: Dict[str, Dict[str, Dict[str, Any]]],
+) -> List[Tuple[str, str, float]]:
+    deltas = []
+    for stage, sizes in results.items():
+        for size, result in sizes.items():
+            previous = baseline.get(stage, {}).get(size)
+            if previous and previous.get("seconds"):
+                delta = result["seconds"] / previous["seconds"] - 1
+                deltas.append((stage, size, delta))
+    return deltas
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Throughput and peak memory of the pipeline hot paths."
+    )
+    parser.add_argument("--sizes", default="10,1000,10000")
+    parser.add_argument("--stages", default=",".join(_STAGES))
+    parser.add_argument("--pool", type=int, default=100)
+    parser.add_argument("--minutes", type=int, default=34)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--baseline", default=_DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=None,
+        help="Exit non-zero when a stage is slower than the baseline by this "
+        "fraction (e.g. 0.2).",
+    )
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = sorted(set(stages) - set(_STAGES))
+    if unknown:
+        raise SystemExit(f"Unknown stages: {', '.join(unknown)}")
+
+    rng = random.Random(args.seed)
+    pool = [
+        generate_match_pair(rng, f"BR1_{index}", minutes=args.minutes)
+        for index in range(min(args.pool, max(sizes)))
+    ]
+
+    results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    print(
+        f"{'stage':34} {'matches':>8} {'seconds':>9} {'matches/s':>11} "
+        f"{'peak MiB':>9}"
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        for stage in stages:
+            # Warm-up so one-off costs (offset tables, caches) don't skew size 10.
+            _STAGES[stage](_Workload(pool, 1, workdir))()
+            for size in sizes:
+                seconds, peak = _measure(
+                    _STAGES[stage],
+                    _Workload(pool, size, workdir),
+                    memory=not args.no_memory,
+                )
+                throughput = size / seconds if seconds else 0.0
+                results.setdefault(stage, {})[str(size)] = {
+                    "seconds": round(seconds, 6),
+                    "matches_per_s": round(throughput, 1),
+                    "peak_bytes": peak,
+                }
+                peak_text = f"{peak / 2**20:9.1f}" if peak is not None else f"{'-':>9}"
+                print(
+                    f"{stage:34} {size:8d} {seconds:9.3f} {throughput:11.1f} "
+                    f"{peak_text}"
+                )
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "pool": len(pool),
+        "minutes": args.minutes,
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.save_baseline:
+        write_json(args.baseline, report)
+        print(f"Baseline saved to {args.baseline}.")
+        return
+    if not os.path.exists(args.baseline):
+        # Timings only compare on the same machine, so the baseline is not
+        # committed; it is saved locally from the commit being compared against.
+        message = (
+            f"No baseline at {args.baseline}; create one with --save-baseline "
+            "on the unchanged tree first."
+        )
+        if args.max_regression is not None:
+            raise SystemExit(message)
+        print(f"\n{message}")
+        return
+
+    deltas = _compare(results, read_json(args.baseline).get("results", {}))
+    print(f"\nAgainst {args.baseline} (positive = slower):")
+    regressions = []
+    for stage, size, delta in deltas:
+        print(f"{stage:34} {size:>8} {delta:+9.1%}")
+        if args.max_regression is not None and delta > args.max_regression:
+            regressions.append(f"{stage}@{size}")
+    if regressions:
+        raise SystemExit(
+            f"Regressions over {args.max_regression:.0%}: {', '.join(regressions)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
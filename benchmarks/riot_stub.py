@@ -0,0 +1,481 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from benchmarks.synthetic import (
+    generate_match,
+    generate_participants,
+    generate_timeline,
+)
+from raw_archive import Location, RawArchive, read_location
+from riot import _parse_limits
+
+
+_PLATFORM = "BR1"
+_FIRST_MATCH_ID = 3_000_000_000
+_START_TS = 1_700_000_000_000
+# Average gap between consecutive synthetic matches.
+_MATCH_GAP_MS = 10 * 60 * 1000
+_QUEUES = (420, 440)
+_TIERS = ("IRON", "BRONZE", "SILVER", "GOLD", "PLATINUM", "EMERALD", "DIAMOND")
+
+
+class _Match:
+    __slots__ = ("match_id", "queue", "start_ts", "puuids", "locations")
+
+    def __init__(
+        self,
+        match_id: str,
+        queue: int,
+        start_ts: int,
+        puuids: List[str],
+        locations: Tuple[Location, Location] | None = None,
+    ) -> None:
+        self.match_id = match_id
+        self.queue = queue
+        self.start_ts = start_ts
+        self.puuids = puuids
+        self.locations = locations
+
+
+class World:
+    # Who played which match. Payloads are generated (or read from a recorded
+    # archive) on request; only this index is built up front.
+    def __init__(self, matches: List[_Match]) -> None:
+        self.matches = {match.match_id: match for match in matches}
+        self.puuids: List[str] = []
+        self.history: Dict[str, List[_Match]] = {}
+        for match in sorted(matches, key=lambda item: item.start_ts, reverse=True):
+            for puuid in match.puuids:
+                if puuid not in self.history:
+                    self.history[puuid] = []
+                    self.puuids.append(puuid)
+                self.history[puuid].append(match)
+
+    @classmethod
+    def synthetic(cls, matches: int, players: int, seed: int = 7) -> "World":
+        rng = random.Random(seed)
+        population = [f"stub-puuid-{index:06d}" for index in range(players)]
+        generated = []
+        for index in range(matches):
+            generated.append(
+                _Match(
+                    f"{_PLATFORM}_{_FIRST_MATCH_ID + index}",
+                    rng.choice(_QUEUES),
+                    _START_TS + index * _MATCH_GAP_MS + rng.randint(0, 300000),
+                    rng.sample(population, 10),
+                )
+            )
+        return cls(generated)
+
+    @classmethod
+    def recorded(cls, root: str, fmt: str) -> "World":
+        # Serves the matches/timelines archived under a data/raw tree.
+        archive = RawArchive(root, fmt)
+        recorded = []
+        for match_id in sorted(archive.keys("matches")):
+            match_location = archive.locate("matches", match_id)
+            timeline_location = archive.locate("match_timelines", match_id)
+            if match_location is None or timeline_location is None:
+                continue
+            info = read_location(match_location).get("info", {})
+            recorded.append(
+                _Match(
+                    match_id,
+                    info.get("queueId") or 0,
+                    info.get("gameStartTimestamp") or 0,
+                    [
+                        participant.get("puuid", "")
+                        for participant in info.get("participants", [])
+                    ],
+                    (match_location, timeline_location),
+                )
+            )
+        return cls(recorded)
+
+    def puuid_for(self, game_name: str, tag_line: str) -> str:
+        # Any Riot ID maps to a stable player of the world.
+        key = f"{game_name}#{tag_line}".lower().encode("utf-8")
+        return self.puuids[zlib.crc32(key) % len(self.puuids)]
+
+
+class _FixedWindows:
+    # Riot-style limits: each window opens with its first request and resets
+    # `window` seconds later.
+    def __init__(self, spec: str) -> None:
+        self.spec = spec
+        self.limits = _parse_limits(spec)
+        self.windows: Dict[int, List[float]] = {}
+
+    def _roll(self, now: float) -> None:
+        for _, window in self.limits:
+            opened = self.windows.get(window)
+            if opened is None or now >= opened[0] + window:
+                self.windows[window] = [now, 0]
+
+    def retry_after(self, now: float) -> float:
+        self._roll(now)
+        waits = [
+            self.windows[window][0] + window - now
+            for limit, window in self.limits
+            if self.windows[window][1] >= limit
+        ]
+        return max(waits, default=0.0)
+
+    def hit(self) -> None:
+        for _, window in self.limits:
+            self.windows[window][1] += 1
+
+    def counts(self) -> str:
+        return ",".join(
+            f"{int(self.windows[window][1])}:{window}" for _, window in self.limits
+        )
+
+
+class StubOptions:
+    def __init__(
+        self,
+        app_limit: str = "20:1,100:120",
+        method_limit: str = "2000:10",
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: int = 7,
+    ) -> None:
+        self.app_limit = app_limit
+        self.method_limit = method_limit
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # Fraction of requests answered 500/503, and 429 without X-Rate-Limit-Type
+        # (Riot's service-level throttling).
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.seed = seed
+
+
+def _summoner(puuid: str) -> Dict[str, Any]:
+    number = zlib.crc32(puuid.encode("utf-8"))
+    return {
+        "id": f"stub-summoner-{number}",
+        "accountId": f"stub-account-{number}",
+        "puuid": puuid,
+        "profileIconId": number % 5000,
+        "revisionDate": _START_TS + number % 10**9,
+        "summonerLevel": 30 + number % 500,
+    }
+
+
+def _league_entries(summoner_id: str) -> List[Dict[str, Any]]:
+    rng = random.Random(summoner_id)
+    wins = rng.randint(10, 300)
+    return [
+        {
+            "leagueId": f"stub-league-{rng.randint(1, 50)}",
+            "queueType": "RANKED_SOLO_5x5",
+            "tier": rng.choice(_TIERS),
+            "rank": rng.choice(("I", "II", "III", "IV")),
+            "summonerId": summoner_id,
+            "leaguePoints": rng.randint(0, 99),
+            "wins": wins,
+            "losses": wins + rng.randint(-20, 20),
+            "veteran": False,
+            "inactive": False,
+            "freshBlood": False,
+            "hotStreak": rng.random() < 0.1,
+        }
+    ]
+
+
+def _champion_mastery(puuid: str) -> List[Dict[str, Any]]:
+    rng = random.Random(puuid)
+    return [
+        {
+            "puuid": puuid,
+            "championId": champion_id,
+            "championLevel": rng.randint(1, 40),
+            "championPoints": rng.randint(1000, 900000),
+            "lastPlayTime": _START_TS + rng.randint(0, 90 * 86400) * 1000,
+        }
+        for champion_id in rng.sample(range(1, 950), 5)
+    ]
+
+
+class RiotStub:
+    def __init__(self, world: World, options: StubOptions) -> None:
+        self.world = world
+        self.options = options
+        self._rng = random.Random(options.seed)
+        self._lock = threading.Lock()
+        self._app = _FixedWindows(options.app_limit)
+        self._methods: Dict[str, _FixedWindows] = {}
+        self.responses: Dict[int, int] = {}
+        self._payload = lru_cache(maxsize=512)(self._render)
+        # (pattern, method name as in riot.py, handler(query params, *path groups))
+        self.routes: List[Tuple[re.Pattern, str, Callable[..., Any]]] = [
+            (
+                re.compile(r"/riot/account/v1/accounts/by-riot-id/([^/]+)/([^/]+)"),
+                "account-v1.by-riot-id",
+                self._account,
+            ),
+            (
+                re.compile(r"/lol/summoner/v4/summoners/by-puuid/([^/]+)"),
+                "summoner-v4.by-puuid",
+                lambda params, puuid: _summoner(puuid),
+            ),
+            (
+                re.compile(r"/lol/league/v4/entries/by-summoner/([^/]+)"),
+                "league-v4.by-summoner",
+                lambda params, summoner_id: _league_entries(summoner_id),
+            ),
+            (
+                re.compile(
+                    r"/lol/champion-mastery/v4/champion-masteries/by-puuid/([^/]+)"
+                ),
+                "champion-mastery-v4.by-puuid",
+                lambda params, puuid: _champion_mastery(puuid),
+            ),
+            (
+                re.compile(r"/lol/match/v5/matches/by-puuid/([^/]+)/ids"),
+                "match-v5.ids-by-puuid",
+                self._match_ids,
+            ),
+            (
+                re.compile(r"/lol/match/v5/matches/([^/]+)/timeline"),
+                "match-v5.timeline",
+                lambda params, match_id: self._match_payload(match_id, "timeline"),
+            ),
+            (
+                re.compile(r"/lol/match/v5/matches/([^/]+)"),
+                "match-v5.match",
+                lambda params, match_id: self._match_payload(match_id, "match"),
+            ),
+        ]
+
+    def _account(
+        self, params: Dict[str, str], game_name: str, tag_line: str
+    ) -> Dict[str, Any]:
+        return {
+            "puuid": self.world.puuid_for(game_name, tag_line),
+            "gameName": game_name,
+            "tagLine": tag_line,
+        }
+
+    def _match_ids(self, params: Dict[str, str], puuid: str) -> List[str]:
+        if puuid not in self.world.history:
+            return []
+        queue = int(params["queue"]) if params.get("queue") else None
+        start_time = int(params.get("startTime") or 0) * 1000
+        start = int(params.get("start") or 0)
+        count = min(int(params.get("count") or 20), 100)
+        ids = [
+            match.match_id
+            for match in self.world.history[puuid]
+            if (queue is None or match.queue == queue) and match.start_ts >= start_time
+        ]
+        return ids[start : start + count]
+
+    def _match_payload(self, match_id: str, kind: str) -> bytes | None:
+        if match_id not in self.world.matches:
+            return None
+        return self._payload(match_id, kind)
+
+    def _render(self, match_id: str, kind: str) -> bytes:
+        match = self.world.matches[match_id]
+        if match.locations is not None:
+            location = match.locations[0 if kind == "match" else 1]
+            return json.dumps(read_location(location)).encode("utf-8")
+        # Seeded per match, so the match and its timeline agree across requests.
+        number = int(match_id.rsplit("_", 1)[1])
+        participants = generate_participants(random.Random(number), match_id)
+        for participant, puuid in zip(participants, match.puuids):
+            participant["puuid"] = puuid
+        if kind == "timeline":
+            timeline = generate_timeline(random.Random(number + 1), match_id)
+            timeline["metadata"]["participants"] = match.puuids
+            return json.dumps(timeline).encode("utf-8")
+        payload = generate_match(
+            random.Random(number + 2),
+            match_id,
+            participants,
+            queue_id=match.queue,
+            start_ts=match.start_ts,
+        )
+        return json.dumps(payload).encode("utf-8")
+
+    def _limit(self, method: str) -> Tuple[int, Dict[str, str]]:
+        with self._lock:
+            limiter = self._methods.get(method)
+            if limiter is None:
+                limiter = self._methods[method] = _FixedWindows(
+                    self.options.method_limit
+                )
+            now = time.monotonic()
+            app_wait = self._app.retry_after(now)
+            method_wait = limiter.retry_after(now)
+            headers: Dict[str, str] = {}
+            if app_wait or method_wait:
+                limit_type = "application" if app_wait >= method_wait else "method"
+                headers["X-Rate-Limit-Type"] = limit_type
+                headers["Retry-After"] = str(math.ceil(max(app_wait, method_wait)))
+                status = 429
+            else:
+                self._app.hit()
+                limiter.hit()
+                status = 200
+            headers.update(
+                {
+                    "X-App-Rate-Limit": self._app.spec,
+                    "X-App-Rate-Limit-Count": self._app.counts(),
+                    "X-Method-Rate-Limit": limiter.spec,
+                    "X-Method-Rate-Limit-Count": limiter.counts(),
+                }
+            )
+            return status, headers
+
+    def _fault(self) -> Tuple[int, Dict[str, str]] | None:
+        with self._lock:
+            roll = self._rng.random()
+            latency = max(
+                self._rng.gauss(self.options.latency_ms, self.options.jitter_ms), 0.0
+            )
+        time.sleep(latency / 1000)
+        if roll < self.options.error_rate:
+            return (500 if roll < self.options.error_rate / 2 else 503), {}
+        if roll < self.options.error_rate + self.options.throttle_rate:
+            return 429, {"Retry-After": "1"}
+        return None
+
+    def handle(
+        self, raw_path: str, api_key: str | None
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        url = urlsplit(raw_path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if not api_key:
+            return _error(401, "Unauthorized")
+        for pattern, method, handler in self.routes:
+            found = pattern.fullmatch(url.path)
+            if found is None:
+                continue
+            status, headers = self._limit(method)
+            if status == 429:
+                return 429, headers, _error(429, "Rate limit exceeded")[2]
+            fault = self._fault()
+            if fault is not None:
+                status, extra = fault
+                headers.update(extra)
+                return status, headers, _error(status, "Injected failure")[2]
+            payload = handler(params, *(unquote(group) for group in found.groups()))
+            if payload is None:
+                return 404, headers, _error(404, "Data not found")[2]
+            if not isinstance(payload, bytes):
+                payload = json.dumps(payload).encode("utf-8")
+            return 200, headers, payload
+        return _error(404, "Not found")
+
+    def record(self, status: int) -> None:
+        with self._lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+
+
+def _error(status: int, message: str) -> Tuple[int, Dict[str, str], bytes]:
+    body = {"status": {"message": message, "status_code": status}}
+    return status, {}, json.dumps(body).encode("utf-8")
+
+
+def make_server(
+    stub: RiotStub, host: str = "127.0.0.1", port: int = 0
+) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self) -> None:
+            status, headers, body = stub.handle(
+                self.path, self.headers.get("X-Riot-Token")
+            )
+            stub.record(status)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json;charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            return
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the Riot API endpoints the pipeline uses."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--matches", type=int, default=2000)
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument(
+        "--recorded", default="", help="Serve the matches archived in this data/raw."
+    )
+    parser.add_argument(
+        "--format", default="gzip", help="Archive format of --recorded."
+    )
+    parser.add_argument("--app-limit", default="20:1,100:120")
+    parser.add_argument("--method-limit", default="2000:10")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.recorded:
+        world = World.recorded(args.recorded, args.format)
+    else:
+        world = World.synthetic(args.matches, args.players, args.seed)
+    if not world.puuids:
+        raise SystemExit("No matches to serve.")
+    stub = RiotStub(
+        world,
+        StubOptions(
+            app_limit=args.app_limit,
+            method_limit=args.method_limit,
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            throttle_rate=args.throttle_rate,
+            seed=args.seed,
+        ),
+    )
+    server = make_server(stub, args.host, args.port)
+    print(
+        f"Serving {len(world.matches)} matches for {len(world.puuids)} players on "
+        f"http://{args.host}:{server.server_address[1]} "
+        "(set RIOT_API_BASE_URL to this address)."
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Responses by status: {dict(sorted(stub.responses.items()))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import random
+from typing import Any, Dict, List, Tuple
+
+# Summoner's Rift playable area in timeline coordinates.
+MAP_MAX = 14870
+_POSITIONS = ("TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY")
+_LANES = ("TOP", "JUNGLE", "MIDDLE", "BOTTOM", "BOTTOM")
+_OBJECTIVES = (
+    "baron", "champion", "dragon", "horde", "inhibitor", "riftHerald", "tower"
+)
+_START_TS = 1_700_000_000_000
+
+
+def _position(rng: random.Random) -> Dict[str, int]:
+    return {"x": rng.randint(0, MAP_MAX), "y": rng.randint(0, MAP_MAX)}
+
+
+def generate_participants(rng: random.Random, match_id: str) -> List[Dict[str, Any]]:
+    participants = []
+    for participant_id in range(1, 11):
+        participants.append(
+            {
+                "participantId": participant_id,
+                "puuid": f"{match_id}-puuid-{participant_id}",
+                "summonerName": f"Player{participant_id}",
+                "championId": rng.randint(1, 950),
+                "teamId": 100 if participant_id <= 5 else 200,
+                "teamPosition": _POSITIONS[(participant_id - 1) % 5],
+            }
+        )
+    return participants
+
+
+def generate_timeline(
+    rng: random.Random, match_id: str, minutes: int = 34
+) -> Dict[str, Any]:
+    frames = []
+    gold = {participant_id: 500 for participant_id in range(1, 11)}
+    xp = {participant_id: 0 for participant_id in range(1, 11)}
+    cs = {participant_id: 0 for participant_id in range(1, 11)}
+    for minute in range(minutes + 1):
+        frame_ts = minute * 60000 + (rng.randint(0, 40) if minute else 0)
+        participant_frames = {}
+        for participant_id in range(1, 11):
+            if minute:
+                gold[participant_id] += rng.randint(250, 500)
+                xp[participant_id] += rng.randint(250, 550)
+                cs[participant_id] += rng.randint(0, 10)
+            participant_frames[str(participant_id)] = {
+                "participantId": participant_id,
+                "totalGold": gold[participant_id],
+                "currentGold": rng.randint(0, 1500),
+                "xp": xp[participant_id],
+                "level": min(18, 1 + xp[participant_id] // 650),
+                "minionsKilled": cs[participant_id],
+                "jungleMinionsKilled": rng.randint(0, 4) * minute // 2,
+                "position": _position(rng),
+            }
+        events: List[Dict[str, Any]] = []
+        if minute == 0:
+            events.append({"type": "PAUSE_END", "timestamp": 0, "realTimestamp": 0})
+        else:
+            for _ in range(rng.randint(8, 22)):
+                events.append(_event(rng, (minute - 1) * 60000 + rng.randint(1, 59999)))
+            events.sort(key=lambda event: event["timestamp"])
+        frames.append(
+            {
+                "timestamp": frame_ts,
+                "participantFrames": participant_frames,
+                "events": events,
+            }
+        )
+    return {
+        "metadata": {"matchId": match_id, "participants": []},
+        "info": {"frameInterval": 60000, "frames": frames},
+    }
+
+
+def _event(rng: random.Random, timestamp: int) -> Dict[str, Any]:
+    roll = rng.random()
+    participant_id = rng.randint(1, 10)
+    if roll < 0.30:
+        return {
+            "type": "ITEM_PURCHASED",
+            "timestamp": timestamp,
+            "participantId": participant_id,
+            "itemId": rng.choice((1055, 1001, 2003, 3006, 3031, 3078, 6672)),
+        }
+    if roll < 0.45:
+        return {
+            "type": "SKILL_LEVEL_UP",
+            "timestamp": timestamp,
+            "participantId": participant_id,
+            "skillSlot": rng.randint(1, 4),
+            "levelUpType": "NORMAL",
+        }
+    if roll < 0.62:
+        return {
+            "type": "WARD_PLACED",
+            "timestamp": timestamp,
+            "creatorId": participant_id,
+            "wardType": rng.choice(("YELLOW_TRINKET", "CONTROL_WARD", "SIGHT_WARD")),
+        }
+    if roll < 0.70:
+        return {
+            "type": "WARD_KILL",
+            "timestamp": timestamp,
+            "killerId": participant_id,
+            "wardType": rng.choice(("YELLOW_TRINKET", "CONTROL_WARD")),
+        }
+    if roll < 0.88:
+        victim_id = rng.choice(
+            [other for other in range(1, 11) if (other <= 5) != (participant_id <= 5)]
+        )
+        return {
+            "type": "CHAMPION_KILL",
+            "timestamp": timestamp,
+            "killerId": participant_id if rng.random() > 0.05 else 0,
+            "victimId": victim_id,
+            "assistingParticipantIds": [],
+            "position": _position(rng),
+            "bounty": 300,
+        }
+    if roll < 0.94:
+        return {
+            "type": "ELITE_MONSTER_KILL",
+            "timestamp": timestamp,
+            "killerId": participant_id,
+            "killerTeamId": 100 if participant_id <= 5 else 200,
+            "monsterType": rng.choice(("DRAGON", "BARON_NASHOR", "RIFTHERALD")),
+            "position": _position(rng),
+        }
+    return {
+        "type": "BUILDING_KILL",
+        "timestamp": timestamp,
+        "killerId": participant_id,
+        "buildingType": rng.choice(("TOWER_BUILDING", "INHIBITOR_BUILDING")),
+        "teamId": 200 if participant_id <= 5 else 100,
+        "position": _position(rng),
+    }
+
+
+def generate_match(
+    rng: random.Random,
+    match_id: str,
+    participants: List[Dict[str, Any]],
+    minutes: int = 34,
+    queue_id: int = 420,
+    start_ts: int | None = None,
+) -> Dict[str, Any]:
+    # match-v5 shaped payload: the fields the transforms read plus the bulky
+    # perks/challenges/teams blocks flatten_dict has to serialize.
+    if start_ts is None:
+        start_ts = _START_TS + rng.randint(0, 90 * 86400) * 1000
+    duration = minutes * 60 + rng.randint(0, 59)
+    blue_win = rng.random() < 0.5
+    players = []
+    for participant in participants:
+        participant_id = participant["participantId"]
+        blue = participant_id <= 5
+        players.append(
+            {
+                **participant,
+                "championName": f"Champion{participant['championId']}",
+                "lane": _LANES[(participant_id - 1) % 5],
+                "role": "SOLO",
+                "individualPosition": participant["teamPosition"],
+                "win": blue == blue_win,
+                "kills": rng.randint(0, 15),
+                "deaths": rng.randint(0, 12),
+                "assists": rng.randint(0, 20),
+                "totalMinionsKilled": rng.randint(20, 300),
+                "neutralMinionsKilled": rng.randint(0, 200),
+                "goldEarned": rng.randint(6000, 20000),
+                "visionScore": rng.randint(5, 90),
+                "totalDamageDealtToChampions": rng.randint(4000, 60000),
+                "totalDamageTaken": rng.randint(8000, 50000),
+                "champLevel": rng.randint(11, 18),
+                "summoner1Id": 4,
+                "summoner2Id": rng.choice((7, 11, 12, 14)),
+                **{
+                    f"item{slot}": rng.choice((0, 1055, 3006, 3031, 6672))
+                    for slot in range(7)
+                },
+                "perks": {
+                    "statPerks": {"defense": 5002, "flex": 5008, "offense": 5005},
+                    "styles": [
+                        {
+                            "description": "primaryStyle",
+                            "style": 8000,
+                            "selections": [
+                                {"perk": 8000 + index, "var1": rng.randint(0, 900)}
+                                for index in range(4)
+                            ],
+                        },
+                        {
+                            "description": "subStyle",
+                            "style": 8100,
+                            "selections": [
+                                {"perk": 8100 + index, "var1": rng.randint(0, 900)}
+                                for index in range(2)
+                            ],
+                        },
+                    ],
+                },
+                "challenges": {
+                    f"challenge{index}": round(rng.random() * 10, 3)
+                    for index in range(40)
+                },
+            }
+        )
+    teams = []
+    for team_id in (100, 200):
+        won = (team_id == 100) == blue_win
+        teams.append(
+            {
+                "teamId": team_id,
+                "win": won,
+                "bans": [
+                    {"championId": rng.randint(1, 950), "pickTurn": turn}
+                    for turn in range(1, 6)
+                ],
+                "objectives": {
+                    name: {"first": won and index == 0, "kills": rng.randint(0, 4)}
+                    for index, name in enumerate(_OBJECTIVES)
+                },
+            }
+        )
+    return {
+        "metadata": {
+            "dataVersion": "2",
+            "matchId": match_id,
+            "participants": [participant["puuid"] for participant in participants],
+        },
+        "info": {
+            "gameCreation": start_ts - rng.randint(30000, 120000),
+            "gameStartTimestamp": start_ts,
+            "gameEndTimestamp": start_ts + duration * 1000,
+            "gameDuration": duration,
+            "gameMode": "CLASSIC",
+            "gameType": "MATCHED_GAME",
+            "gameVersion": (
+                f"14.{rng.randint(1, 20)}.{rng.randint(500, 700)}."
+                f"{rng.randint(1000, 9999)}"
+            ),
+            "mapId": 11,
+            "platformId": "BR1",
+            "queueId": queue_id,
+            "participants": players,
+            "teams": teams,
+        },
+    }
+
+
+def generate_match_pair(
+    rng: random.Random, match_id: str, minutes: int = 34, queue_id: int = 420
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # (match, timeline) sharing one set of participants.
+    participants = generate_participants(rng, match_id)
+    timeline = generate_timeline(rng, match_id, minutes)
+    return generate_match(rng, match_id, participants, minutes, queue_id), timeline
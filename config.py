@@ -1,14 +1,83 @@
 import os
 
+from dotenv import load_dotenv
 
-def _env(key: str, default: str) -> str:
+
+# Loaded before any setting below is read, so every entry point (api, replay,
+# frame_store) sees .env; variables already set in the environment win.
+load_dotenv(".env")
+
+
+def _env(key: str, default: str, allow_empty: bool = False) -> str:
+    # Unset uses the default. An empty value does too, except for settings where
+    # empty means "disabled" (allow_empty).
     value = os.getenv(key)
-    return value.strip() if value else default
+    if value is None:
+        return default
+    value = value.strip()
+    return value if value or allow_empty else default
 
 
 RIOT_ID_GAME_NAME = _env("RIOT_ID_GAME_NAME", "furacaoPEDRINHO")
 RIOT_ID_TAG_LINE = _env("RIOT_ID_TAG_LINE", "BR1").upper()
+# Comma-separated "name#tag" list; when empty the single Riot ID above is used.
+RIOT_IDS = _env("RIOT_IDS", "")
+# Depth 0 tracks only the listed accounts; each extra level adds the participants
+# of the selected matches, capped at CRAWL_MAX_PLAYERS tracked players.
+CRAWL_DEPTH = int(_env("CRAWL_DEPTH", "0"))
+CRAWL_MAX_PLAYERS = int(_env("CRAWL_MAX_PLAYERS", "50"))
+CRAWL_MATCHES_PER_PLAYER = int(_env("CRAWL_MATCHES_PER_PLAYER", "20"))
 RIOT_PLATFORM_ROUTING = _env("RIOT_PLATFORM_ROUTING", "br1")
 RIOT_REGIONAL_ROUTING = _env("RIOT_REGIONAL_ROUTING", "americas")
+# Send every Riot API request here instead of https://{routing}.api.riotgames.com,
+# e.g. http://127.0.0.1:8080 for benchmarks/riot_stub.py.
+RIOT_API_BASE_URL = _env("RIOT_API_BASE_URL", "")
 DATA_DIR = _env("DATA_DIR", os.path.join("data", "raw"))
 CSV_DIR = _env("CSV_DIR", os.path.join("data", "csv"))
+# Per puuid/queue discovery state; delete it to rediscover from scratch.
+WATERMARK_PATH = _env("WATERMARK_PATH", os.path.join(DATA_DIR, "watermarks.json"))
+RIOT_MAX_WORKERS = int(_env("RIOT_MAX_WORKERS", "8"))
+# Matches fetched ahead of the transform; bounds the payloads held in memory.
+MAX_IN_FLIGHT_MATCHES = int(_env("MAX_IN_FLIGHT_MATCHES", "16"))
+# Run journal and per-match row spill files; an unfinished run resumes from here.
+RUN_JOURNAL_DIR = _env("RUN_JOURNAL_DIR", os.path.join("data", "run"))
+# Matches between saves of the raw archive/cache index (the journal's "raw" stage).
+RUN_CHECKPOINT_MATCHES = int(_env("RUN_CHECKPOINT_MATCHES", "25"))
+CACHE_MAX_ENTRIES = int(_env("CACHE_MAX_ENTRIES", "256"))
+CACHE_TTL_SECONDS = int(_env("CACHE_TTL_SECONDS", "900"))
+# Raw match/timeline archive: "gzip", "lzma", "json" (compact) or "pack".
+RAW_FORMAT = _env("RAW_FORMAT", "gzip").lower()
+# "csv" rewrites flat CSVs each run; "partitioned" appends date partitions.
+OUTPUT_MODE = _env("OUTPUT_MODE", "csv").lower()
+PARTITION_DIR = _env("PARTITION_DIR", os.path.join("data", "partitioned"))
+# Worker processes for replay.py; 0 uses every CPU.
+REPLAY_WORKERS = int(_env("REPLAY_WORKERS", "0"))
+DDRAGON_DIR = _env("DDRAGON_DIR", os.path.join("data", "ddragon"))
+DDRAGON_LOCALE = _env("DDRAGON_LOCALE", "pt_BR")
+DDRAGON_VERSIONS_TTL_SECONDS = int(_env("DDRAGON_VERSIONS_TTL_SECONDS", "3600"))
+# Run report (JSON) and Prometheus textfile-collector output; empty disables.
+METRICS_JSON_PATH = _env(
+    "METRICS_JSON_PATH",
+    os.path.join("data", "metrics", "run_metrics.json"),
+    allow_empty=True,
+)
+METRICS_PROM_PATH = _env(
+    "METRICS_PROM_PATH",
+    os.path.join("data", "metrics", "riot_pipeline.prom"),
+    allow_empty=True,
+)
+# Incremental fact_match_player rollups (agg_* tables); empty disables.
+ROLLUP_STATE_PATH = _env(
+    "ROLLUP_STATE_PATH", os.path.join("data", "rollups.json"), allow_empty=True
+)
+# Per-cell event counts on the 64x64 map grid (agg_heatmap_*, SQLite); empty
+# disables.
+HEATMAP_STATE_PATH = _env(
+    "HEATMAP_STATE_PATH", os.path.join("data", "heatmaps.sqlite"), allow_empty=True
+)
+# Per-minute participant frames (typed columnar segments); empty disables.
+FRAME_STORE_DIR = _env(
+    "FRAME_STORE_DIR", os.path.join("data", "frames"), allow_empty=True
+)
+# Optional SQLite star schema loaded alongside the CSVs; empty disables it.
+SQLITE_PATH = _env("SQLITE_PATH", "")
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+from response_cache import ResponseCache
+from riot import RiotClient, fetch_many, get_match_ids_by_puuid
+from watermarks import WatermarkStore
+
+
+def parse_riot_ids(value: str) -> List[Tuple[str, str]]:
+    # "name#TAG, other#TAG" -> [("name", "TAG"), ("other", "TAG")]
+    riot_ids: List[Tuple[str, str]] = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        game_name, separator, tag_line = item.rpartition("#")
+        if not separator or not game_name or not tag_line:
+            raise ValueError(f"Invalid Riot ID '{item}'; expected name#tag.")
+        riot_ids.append((game_name.strip(), tag_line.strip().upper()))
+    return riot_ids
+
+
+def _get_queue_match_ids(
+    client: RiotClient,
+    puuid: str,
+    queue: int,
+    desired: int,
+    start_time: int | None = None,
+    batch: int = 20,
+) -> List[str]:
+    # Newest first; stops once `desired` IDs are listed or the list runs out.
+    match_ids: List[str] = []
+    start = 0
+    while len(match_ids) < desired:
+        ids = get_match_ids_by_puuid(
+            client, puuid, count=batch, start=start, queue=queue, start_time=start_time
+        )
+        match_ids.extend(ids)
+        if len(ids) < batch:
+            break
+        start += batch
+    return match_ids
+
+
+class MatchCrawler:
+    # Every tracked player contributes their latest `matches_per_player` matches in
+    # `queues`; match IDs go through one shared queue, so a match shared by several
+    # tracked players is fetched once. With max_depth > 0 the participants of the
+    # selected matches are tracked as well, up to max_players in total.
+    #
+    # With a WatermarkStore, each (puuid, queue) only lists matches started since
+    # its newest known match and merges them with the IDs kept from earlier runs;
+    # known matches are filtered and sorted from the cache index metadata.
+    def __init__(
+        self,
+        client: RiotClient,
+        cache: ResponseCache,
+        queues: Sequence[int],
+        matches_per_player: int = 20,
+        max_depth: int = 0,
+        max_players: int = 50,
+        max_workers: int = 8,
+        watermarks: WatermarkStore | None = None,
+    ) -> None:
+        self.client = client
+        self.cache = cache
+        self.queues = list(queues)
+        self.matches_per_player = matches_per_player
+        self.max_depth = max_depth
+        self.max_players = max_players
+        self.max_workers = max_workers
+        self.watermarks = watermarks
+        # puuid -> crawl depth (0 for seeds), in discovery order.
+        self.tracked: Dict[str, int] = {}
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._selected: Dict[str, None] = {}
+
+    def _match_ids(self, client: RiotClient, puuid: str) -> List[str]:
+        match_ids: List[str] = []
+        for queue in self.queues:
+            watermark = (
+                self.watermarks.get(puuid, queue) if self.watermarks is not None else None
+            )
+            if watermark is None:
+                match_ids.extend(
+                    _get_queue_match_ids(
+                        client, puuid, queue, desired=self.matches_per_player
+                    )
+                )
+                continue
+            match_ids.extend(
+                _get_queue_match_ids(
+                    client,
+                    puuid,
+                    queue,
+                    desired=self.matches_per_player,
+                    start_time=watermark["game_start"] // 1000,
+                )
+            )
+            match_ids.extend(watermark["match_ids"])
+        return list(dict.fromkeys(match_ids))
+
+    def _start(self, match_id: str) -> int:
+        return self._meta[match_id].get("gameStartTimestamp") or 0
+
+    def _fetch_meta(self, match_ids: List[str]) -> None:
+        # Known matches come from the cache index; only new ones hit the API.
+        missing: List[str] = []
+        for match_id in match_ids:
+            if match_id in self._meta:
+                continue
+            meta = self.cache.match_meta(match_id)
+            if meta is None:
+                missing.append(match_id)
+            else:
+                self._meta[match_id] = meta
+        # Fetched payloads are persisted by the cache and dropped here; only the
+        # index metadata stays in memory.
+        for match_id, _ in fetch_many(
+            self.client, self.cache.match, missing, max_workers=self.max_workers
+        ):
+            self._meta[match_id] = self.cache.match_meta(match_id) or {}
+
+    def _participants(self, match_ids: List[str]) -> Iterator[str]:
+        # Re-read from the cache one match at a time; nothing is fetched twice.
+        for _, match in fetch_many(
+            self.client, self.cache.match, match_ids, max_workers=self.max_workers
+        ):
+            for participant in match.get("info", {}).get("participants", []):
+                puuid = participant.get("puuid")
+                if puuid:
+                    yield puuid
+
+    def _latest(self, match_ids: List[str], queues: Sequence[int]) -> List[str]:
+        allowed = set(queues)
+        ranked = [
+            match_id
+            for match_id in match_ids
+            if self._meta[match_id].get("queueId") in allowed
+        ]
+        ranked.sort(key=self._start, reverse=True)
+        return ranked[: self.matches_per_player]
+
+    def _advance(self, puuid: str, match_ids: List[str]) -> None:
+        if self.watermarks is None:
+            return
+        for queue in self.queues:
+            latest = self._latest(match_ids, [queue])
+            if latest:
+                self.watermarks.update(puuid, queue, latest, self._start(latest[0]))
+
+    def crawl(self, seed_puuids: Sequence[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        frontier = list(dict.fromkeys(seed_puuids))
+        depth = 0
+        while frontier:
+            for puuid in frontier:
+                self.tracked.setdefault(puuid, depth)
+            # Discovery is per player, the fetch is shared across the whole frontier.
+            player_match_ids = list(
+                fetch_many(
+                    self.client, self._match_ids, frontier, max_workers=self.max_workers
+                )
+            )
+            self._fetch_meta(
+                list(
+                    dict.fromkeys(
+                        match_id for _, ids in player_match_ids for match_id in ids
+                    )
+                )
+            )
+            selected: List[str] = []
+            for puuid, ids in player_match_ids:
+                self._advance(puuid, ids)
+                for match_id in self._latest(ids, self.queues):
+                    if match_id not in self._selected:
+                        self._selected[match_id] = None
+                        selected.append(match_id)
+
+            if depth >= self.max_depth:
+                break
+            depth += 1
+            frontier = []
+            for puuid in self._participants(selected):
+                if len(self.tracked) + len(frontier) >= self.max_players:
+                    break
+                if puuid not in self.tracked and puuid not in frontier:
+                    frontier.append(puuid)
+
+        # (match_id, index metadata) newest first; payloads are read back from the
+        # cache by whoever processes them.
+        return sorted(
+            ((match_id, self._meta[match_id]) for match_id in self._selected),
+            key=lambda item: self._start(item[0]),
+            reverse=True,
+        )
@@ -1,7 +1,12 @@
+from __future__ import annotations
+
 import csv
 import json
 import os
-from typing import Any, Dict, Iterable, List
+import pickle
+import uuid
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Set, Tuple
 
 
 def _ensure_dir(path: str) -> None:
@@ -21,38 +26,307 @@ def flatten_dict(data: Dict[str, Any], prefix: str = "", sep: str = ".") -> Dict
     return flattened
 
 
-def _write_rows(path: str, rows: List[Dict[str, Any]]) -> None:
-    directory = os.path.dirname(path)
-    if directory:
-        _ensure_dir(directory)
-    fieldnames = sorted({key for row in rows for key in row.keys()})
-    with open(path, "w", newline="", encoding="utf-8") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames)
-        writer.writeheader()
+def _getter(keys: Tuple[str, ...]) -> Callable[[Dict[str, Any]], Tuple[Any, ...]]:
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda node: (node[key],)
+    return itemgetter(*keys)
+
+
+def _values(
+    getter: Callable[[Dict[str, Any]], Tuple[Any, ...]],
+    keys: Tuple[str, ...],
+    node: Dict[str, Any],
+) -> Tuple[Any, ...]:
+    try:
+        return getter(node)
+    except KeyError:
+        # Optional field missing from this payload.
+        return tuple(node.get(key) for key in keys)
+
+
+_NESTED = {dict, list}
+
+
+def _scalar(value: Any) -> Any:
+    # A non-dict value as flatten_dict writes it.
+    return json.dumps(value, ensure_ascii=True) if isinstance(value, list) else value
+
+
+class CompiledFlattener:
+    # Same columns as flatten_dict, but the key paths are compiled once (from the
+    # first payload seen) into a flat plan of per-dict getters, so a call is a few
+    # itemgetter lookups instead of a recursive walk building every key. Paths in
+    # `skip` are left out (the caller explodes them into child tables). A payload
+    # carrying keys the plan has not seen recompiles it with the union.
+    def __init__(self, skip: Iterable[str] = (), sep: str = ".") -> None:
+        self.skip = set(skip)
+        self.sep = sep
+        # path -> {key: "scalar" | "list" | "dict" | "skip"}, parents before children
+        self._shape: Dict[Tuple[str, ...], Dict[str, str]] = {}
+        self._plan: List[Tuple[Any, ...]] = []
+
+    def _learn(self, data: Dict[str, Any], path: Tuple[str, ...] = ()) -> None:
+        kinds = self._shape.setdefault(path, {})
+        for key, value in data.items():
+            child = (*path, key)
+            if self.sep.join(child) in self.skip:
+                kinds[key] = "skip"
+            elif isinstance(value, dict):
+                kinds[key] = "dict"
+                self._learn(value, child)
+            elif isinstance(value, list):
+                # A dict seen earlier keeps its kind; see __call__.
+                if kinds.get(key) != "dict":
+                    kinds[key] = "list"
+            else:
+                # A null seen after a dict/list keeps the richer kind.
+                kinds.setdefault(key, "scalar")
+
+    def _compile(self) -> None:
+        plan = []
+        positions: Dict[Tuple[str, ...], int] = {}
+        for path, kinds in self._shape.items():
+            prefix = self.sep.join(path) + self.sep if path else ""
+            groups = []
+            for kind in ("scalar", "list"):
+                keys = tuple(key for key, value in kinds.items() if value == kind)
+                columns = tuple(prefix + key for key in keys)
+                groups.append((keys, columns, _getter(keys) if keys else None))
+            positions[path] = len(plan)
+            parent = positions[path[:-1]] if path else -1
+            key = path[-1] if path else ""
+            column = self.sep.join(path)
+            plan.append((parent, key, column, set(kinds), *groups))
+        self._plan = plan
+
+    def _relearn(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        self._learn(data)
+        self._compile()
+        return self(data)
+
+    def __call__(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        # The plan follows the kinds seen so far; a value of another kind is
+        # flattened the way flatten_dict would. A dict where the plan expects a
+        # scalar or a list upgrades the key to "dict" and recompiles.
+        if not self._plan:
+            self._learn(data)
+            self._compile()
+        row: Dict[str, Any] = {}
+        nodes: List[Dict[str, Any] | None] = []
+        for parent, key, column, known, scalars, lists in self._plan:
+            node = data
+            if parent >= 0:
+                node = nodes[parent]
+                if node is not None:
+                    value = node.get(key)
+                    if isinstance(value, dict):
+                        node = value
+                    else:
+                        if key in node:
+                            # Null, scalar or list in place of the usual dict.
+                            row[column] = _scalar(value)
+                        node = None
+            nodes.append(node)
+            if node is None:
+                continue
+            if not node.keys() <= known:
+                return self._relearn(data)
+            keys, columns, getter = scalars
+            if getter is not None:
+                values = _values(getter, keys, node)
+                if _NESTED.isdisjoint(map(type, values)):
+                    row.update(zip(columns, values))
+                elif dict in map(type, values):
+                    return self._relearn(data)
+                else:
+                    row.update(zip(columns, map(_scalar, values)))
+            keys, columns, getter = lists
+            if getter is not None:
+                values = _values(getter, keys, node)
+                if dict in map(type, values):
+                    return self._relearn(data)
+                row.update(zip(columns, map(_scalar, values)))
+        return row
+
+
+class StreamingCsvWriter:
+    # Rows go straight to disk. With a declared schema they are written as CSV
+    # immediately; otherwise they are pickled to a spill file and the header (the
+    # sorted union of keys, as before) is fixed on close. Output is published with
+    # an atomic rename, so readers never see a half-written CSV.
+    def __init__(self, path: str, fieldnames: Sequence[str] | None = None) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            _ensure_dir(directory)
+        self._directory = directory or "."
+        self._fieldnames = list(fieldnames) if fieldnames is not None else None
+        self._keys: Set[str] = set()
+        self.row_count = 0
+        self._csv_path: str | None = None
+        if self._fieldnames is not None:
+            self._tmp_path = self._mkstemp(".csv.tmp")
+            self._handle: Any = open(self._tmp_path, "w", newline="", encoding="utf-8")
+            self._writer = csv.DictWriter(self._handle, fieldnames=self._fieldnames)
+            self._writer.writeheader()
+        else:
+            self._tmp_path = self._mkstemp(".spill")
+            self._handle = open(self._tmp_path, "wb")
+
+    def _mkstemp(self, suffix: str) -> str:
+        # Opened later with plain open() so the published CSV keeps umask permissions.
+        name = f".{os.path.basename(self.path)}.{uuid.uuid4().hex}{suffix}"
+        return os.path.join(self._directory, name)
+
+    def writerow(self, row: Dict[str, Any]) -> None:
+        self.row_count += 1
+        if self._fieldnames is not None:
+            self._writer.writerow(row)
+            return
+        self._keys.update(row.keys())
+        pickle.dump(row, self._handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def writerows(self, rows: Iterable[Dict[str, Any]]) -> None:
         for row in rows:
-            writer.writerow(row)
+            self.writerow(row)
+
+    def prepare(self) -> None:
+        # Finishes the hidden CSV next to `path`; publish() renames it into place.
+        # Split so several outputs can be fully written before any is published.
+        if self._csv_path is not None:
+            return
+        self._handle.close()
+        if self._fieldnames is not None:
+            self._csv_path = self._tmp_path
+            return
+        csv_path = self._mkstemp(".csv.tmp")
+        try:
+            with open(self._tmp_path, "rb") as spill, open(
+                csv_path, "w", newline="", encoding="utf-8"
+            ) as handle:
+                writer = csv.DictWriter(handle, fieldnames=sorted(self._keys))
+                writer.writeheader()
+                for _ in range(self.row_count):
+                    writer.writerow(pickle.load(spill))
+        except BaseException:
+            if os.path.exists(csv_path):
+                os.remove(csv_path)
+            raise
+        finally:
+            os.remove(self._tmp_path)
+        self._csv_path = csv_path
+
+    def publish(self) -> None:
+        self.prepare()
+        os.replace(self._csv_path, self.path)
+
+    def close(self) -> None:
+        self.publish()
+
+    def abort(self) -> None:
+        self._handle.close()
+        for path in (self._tmp_path, self._csv_path):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self) -> "StreamingCsvWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class UpsertCsvWriter:
+    # Rewrites `path` as its existing rows plus the new rows whose key columns are
+    # not in it yet, both streamed through one StreamingCsvWriter; only the keys are
+    # kept in memory. `keep` filters existing and new rows alike.
+    def __init__(
+        self,
+        path: str,
+        key_columns: Sequence[str],
+        keep: Callable[[Dict[str, Any]], bool] | None = None,
+    ) -> None:
+        self.key_columns = tuple(key_columns)
+        self.keep = keep
+        self._keys: Set[Tuple[str, ...]] = set()
+        self._writer = StreamingCsvWriter(path)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", newline="", encoding="utf-8") as handle:
+                for row in csv.DictReader(handle):
+                    # Existing keys are always claimed, even for rows `keep` drops.
+                    self._keys.add(self._key(row))
+                    if keep is None or keep(row):
+                        self._writer.writerow(row)
+        except BaseException:
+            self._writer.abort()
+            raise
+
+    def _key(self, row: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(row.get(column, "")) for column in self.key_columns)
+
+    def writerows(self, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Returns the rows actually inserted.
+        written: List[Dict[str, Any]] = []
+        for row in rows:
+            if self.keep is not None and not self.keep(row):
+                continue
+            key = self._key(row)
+            if key in self._keys:
+                continue
+            self._keys.add(key)
+            self._writer.writerow(row)
+            written.append(row)
+        return written
+
+    def prepare(self) -> None:
+        self._writer.prepare()
+
+    def close(self) -> None:
+        self._writer.close()
+
+    def abort(self) -> None:
+        self._writer.abort()
+
+    def __enter__(self) -> "UpsertCsvWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        self._writer.__exit__(exc_type, exc, traceback)
+
+
+def write_csv(
+    path: str,
+    rows: Iterable[Dict[str, Any]],
+    fieldnames: Sequence[str] | None = None,
+) -> None:
+    with StreamingCsvWriter(path, fieldnames=fieldnames) as writer:
+        writer.writerows(rows)
 
 
-def write_csv(path: str, rows: Iterable[Dict[str, Any]]) -> None:
-    rows_list = list(rows)
-    if not rows_list:
-        _write_rows(path, [])
+def read_csv(path: str) -> Iterator[Dict[str, str]]:
+    # Streams the rows of a published CSV; a missing file has none.
+    if not os.path.exists(path):
         return
-    _write_rows(path, rows_list)
+    with open(path, "r", newline="", encoding="utf-8") as handle:
+        yield from csv.DictReader(handle)
 
 
 def write_data_as_csv(path: str, data: Any) -> None:
     if isinstance(data, dict):
-        _write_rows(path, [flatten_dict(data)])
+        write_csv(path, [flatten_dict(data)])
         return
 
     if isinstance(data, list):
         if data and all(isinstance(item, dict) for item in data):
-            rows = [flatten_dict(item) for item in data]
-            _write_rows(path, rows)
+            write_csv(path, (flatten_dict(item) for item in data))
         else:
-            rows = [{"value": item} for item in data]
-            _write_rows(path, rows)
+            write_csv(path, ({"value": item} for item in data))
         return
 
-    _write_rows(path, [{"value": data}])
+    write_csv(path, [{"value": data}])
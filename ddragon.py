@@ -1,28 +1,53 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+import os
+import time
+from typing import Any, Dict, Iterable, List, Sequence
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from storage import read_json, write_json
+
+
+_DDRAGON_URL = "https://ddragon.leagueoflegends.com"
+_QUEUES_URL = "https://static.developer.riotgames.com/docs/lol/queues.json"
+# dimension table -> Data Dragon file under /cdn/{version}/data/{locale}/
+_STATIC_FILES = {
+    "dim_champion": "champion",
+    "dim_item": "item",
+    "dim_summoner_spell": "summoner",
+    "dim_rune": "runesReforged",
+}
+
+
+def resolve_version(game_version: str, versions: Sequence[str]) -> str:
+    # Match gameVersion "14.1.555.1234" to the newest Data Dragon release of the
+    # same patch ("14.1.1"); unknown patches fall back to the latest release.
+    parts = (game_version or "").split(".")
+    if len(parts) >= 2:
+        prefix = f"{parts[0]}.{parts[1]}."
+        for version in versions:
+            if version.startswith(prefix):
+                return version
+    return versions[0] if versions else ""
+
+
+def _version_key(version: str) -> List[int]:
+    # "14.10.1" sorts after "14.9.1"; non-numeric parts (e.g. "lolpatch_7.20") are
+    # ignored.
+    return [int(part) for part in version.split(".") if part.isdigit()]
 
-def fetch_champion_dimension(locale: str = "pt_BR") -> List[Dict[str, Any]]:
-    versions_response = requests.get(
-        "https://ddragon.leagueoflegends.com/api/versions.json", timeout=20
-    )
-    versions_response.raise_for_status()
-    versions = versions_response.json()
-    if not versions:
-        return []
-    version = versions[0]
-    champions_response = requests.get(
-        f"https://ddragon.leagueoflegends.com/cdn/{version}/data/{locale}/champion.json",
-        timeout=20,
-    )
-    champions_response.raise_for_status()
-    payload = champions_response.json().get("data", {})
 
+def cached_versions(cache_dir: str) -> List[str]:
+    # Offline view of versions.json (empty when never downloaded).
+    path = os.path.join(cache_dir, "versions.json")
+    return read_json(path) if os.path.exists(path) else []
+
+
+def _champion_rows(payload: Dict[str, Any], version: str) -> List[Dict[str, Any]]:
     rows: List[Dict[str, Any]] = []
-    for champion in payload.values():
+    for champion in payload.get("data", {}).values():
         tags = champion.get("tags", []) or []
         rows.append(
             {
@@ -32,6 +57,202 @@ def fetch_champion_dimension(locale: str = "pt_BR") -> List[Dict[str, Any]]:
                 "championTitle": champion.get("title", ""),
                 "primaryClass": tags[0] if len(tags) > 0 else "",
                 "secondaryClass": tags[1] if len(tags) > 1 else "",
+                "version": version,
+            }
+        )
+    return rows
+
+
+def _item_rows(payload: Dict[str, Any], version: str) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for item_id, item in payload.get("data", {}).items():
+        gold = item.get("gold", {}) or {}
+        rows.append(
+            {
+                "itemId": int(item_id),
+                "itemName": item.get("name", ""),
+                "plaintext": item.get("plaintext", ""),
+                "goldTotal": gold.get("total"),
+                "goldBase": gold.get("base"),
+                "goldSell": gold.get("sell"),
+                "purchasable": 1 if gold.get("purchasable") else 0,
+                "tags": "|".join(item.get("tags", []) or []),
+                "version": version,
             }
         )
     return rows
+
+
+def _summoner_spell_rows(
+    payload: Dict[str, Any], version: str
+) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for spell in payload.get("data", {}).values():
+        rows.append(
+            {
+                "spellId": int(spell.get("key", 0) or 0),
+                "spellKey": spell.get("id", ""),
+                "spellName": spell.get("name", ""),
+                "cooldown": spell.get("cooldownBurn", ""),
+                "summonerLevel": spell.get("summonerLevel"),
+                "modes": "|".join(spell.get("modes", []) or []),
+                "version": version,
+            }
+        )
+    return rows
+
+
+def _rune_rows(payload: List[Dict[str, Any]], version: str) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for tree in payload:
+        for slot_index, slot in enumerate(tree.get("slots", []) or []):
+            for rune in slot.get("runes", []) or []:
+                rows.append(
+                    {
+                        "runeId": rune.get("id"),
+                        "runeKey": rune.get("key", ""),
+                        "runeName": rune.get("name", ""),
+                        "treeId": tree.get("id"),
+                        "treeKey": tree.get("key", ""),
+                        "treeName": tree.get("name", ""),
+                        "slot": slot_index,
+                        "version": version,
+                    }
+                )
+    return rows
+
+
+def _queue_rows(payload: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "queueId": queue.get("queueId"),
+            "map": queue.get("map", ""),
+            "description": queue.get("description") or "",
+            "notes": queue.get("notes") or "",
+        }
+        for queue in payload
+    ]
+
+
+_BUILDERS = {
+    "dim_champion": _champion_rows,
+    "dim_item": _item_rows,
+    "dim_summoner_spell": _summoner_spell_rows,
+    "dim_rune": _rune_rows,
+}
+
+
+class DataDragon:
+    # Static files are immutable per version, so they are downloaded once into
+    # cache_dir/{version}/{locale}/. Only versions.json (and the unversioned queue
+    # list) is re-fetched, after versions_ttl seconds; a new versions[0] is what
+    # triggers fresh downloads.
+    def __init__(
+        self,
+        cache_dir: str,
+        locale: str = "pt_BR",
+        versions_ttl: float = 3600,
+        timeout: float = 20,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.locale = locale
+        self.versions_ttl = versions_ttl
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+        self.session.mount("https://", adapter)
+        self._versions: List[str] | None = None
+
+    def _get(self, url: str) -> Any:
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _fresh(self, path: str) -> bool:
+        return (
+            os.path.exists(path)
+            and time.time() - os.path.getmtime(path) < self.versions_ttl
+        )
+
+    def _refreshed(self, name: str, url: str) -> Any:
+        path = os.path.join(self.cache_dir, name)
+        if self._fresh(path):
+            return read_json(path)
+        try:
+            payload = self._get(url)
+        except requests.RequestException:
+            # A stale copy beats failing the whole run.
+            if os.path.exists(path):
+                return read_json(path)
+            raise
+        write_json(path, payload, compact=True)
+        return payload
+
+    def versions(self) -> List[str]:
+        if self._versions is None:
+            self._versions = self._refreshed(
+                "versions.json", f"{_DDRAGON_URL}/api/versions.json"
+            )
+        return self._versions
+
+    def latest(self) -> str:
+        versions = self.versions()
+        return versions[0] if versions else ""
+
+    def resolve(self, game_version: str) -> str:
+        return resolve_version(game_version, self.versions())
+
+    def static_file(self, version: str, name: str) -> Any:
+        path = os.path.join(self.cache_dir, version, self.locale, f"{name}.json")
+        if os.path.exists(path):
+            return read_json(path)
+        payload = self._get(
+            f"{_DDRAGON_URL}/cdn/{version}/data/{self.locale}/{name}.json"
+        )
+        write_json(path, payload, compact=True)
+        return payload
+
+    def queues(self) -> List[Dict[str, Any]]:
+        return self._refreshed("queues.json", _QUEUES_URL)
+
+    def downloaded_versions(self) -> List[str]:
+        # Every release with static files in the local cache, i.e. every version
+        # an earlier run wrote dimensions (and fact rows) for.
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [
+            name
+            for name in os.listdir(self.cache_dir)
+            if os.path.isdir(os.path.join(self.cache_dir, name, self.locale))
+        ]
+
+    def dimensions(self, versions: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+        # One row set per (table, version), keyed on the entity id plus version.
+        # dim_champion_latest keeps one row per championId (from the newest
+        # release that has it) for models that join on championId alone.
+        tables: Dict[str, List[Dict[str, Any]]] = {table: [] for table in _BUILDERS}
+        latest: Dict[int, Dict[str, Any]] = {}
+        for version in sorted(
+            {version for version in versions if version}, key=_version_key, reverse=True
+        ):
+            for table, builder in _BUILDERS.items():
+                rows = builder(self.static_file(version, _STATIC_FILES[table]), version)
+                tables[table].extend(rows)
+                if table == "dim_champion":
+                    for row in rows:
+                        latest.setdefault(row["championId"], row)
+        tables["dim_champion_latest"] = sorted(
+            latest.values(), key=lambda row: row["championId"]
+        )
+        tables["dim_queue"] = _queue_rows(self.queues())
+        return tables
+
+
+def fetch_champion_dimension(
+    locale: str = "pt_BR", cache_dir: str = os.path.join("data", "ddragon")
+) -> List[Dict[str, Any]]:
+    ddragon = DataDragon(cache_dir, locale=locale)
+    version = ddragon.latest()
+    if not version:
+        return []
+    return _champion_rows(ddragon.static_file(version, "champion"), version)
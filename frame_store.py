@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import argparse
+import os
+from array import array
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from config import CSV_DIR, FRAME_STORE_DIR
+from csv_exporter import write_csv
+from storage import atomic_write, read_json, write_json
+
+
+_ROLES = ("TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY")
+_TEAMS = (100, 200)
+# column -> array typecode (also the NumPy dtype on disk). team is the _TEAMS
+# index, role the _ROLES index + 1 (0 when unknown). The match column is not
+# stored: it is implied by the offset index.
+_COLUMNS = (
+    ("participant", "B"),
+    ("team", "B"),
+    ("role", "B"),
+    ("minute", "H"),
+    ("gold", "i"),
+    ("xp", "i"),
+    ("cs", "i"),
+    ("level", "B"),
+    ("x", "h"),
+    ("y", "h"),
+)
+_DIFF_COLUMNS = (
+    "match",
+    "participant",
+    "team",
+    "role",
+    "minute",
+    "gold",
+    "opponent_gold",
+    "gold_diff",
+)
+# ~26 MB of pending rows before a segment is written.
+_SEGMENT_ROWS = 1_000_000
+
+
+def extract_frames(
+    frames: Iterable[Dict[str, Any]], participants: Iterable[Dict[str, Any]]
+) -> Dict[str, array]:
+    # One row per participant per minute of a timeline.
+    slots: Dict[int, Tuple[int, int]] = {}
+    for participant in participants:
+        team_id = participant.get("teamId")
+        position = participant.get("teamPosition")
+        slots[participant.get("participantId")] = (
+            _TEAMS.index(team_id) if team_id in _TEAMS else -1,
+            _ROLES.index(position) + 1 if position in _ROLES else 0,
+        )
+    columns = {name: array(code) for name, code in _COLUMNS}
+    last_minute = -1
+    for frame in frames:
+        minute = round((frame.get("timestamp") or 0) / 60000)
+        # The end-of-game frame can round onto the previous minute; the frame on
+        # the minute wins.
+        if minute == last_minute:
+            continue
+        last_minute = minute
+        for key, participant_frame in frame.get("participantFrames", {}).items():
+            participant_id = participant_frame.get("participantId") or int(key)
+            team, role = slots.get(participant_id, (-1, 0))
+            if team < 0:
+                team = 0 if participant_id <= 5 else 1
+            position = participant_frame.get("position") or {}
+            columns["participant"].append(participant_id)
+            columns["team"].append(team)
+            columns["role"].append(role)
+            columns["minute"].append(minute)
+            columns["gold"].append(participant_frame.get("totalGold") or 0)
+            columns["xp"].append(participant_frame.get("xp") or 0)
+            columns["cs"].append(
+                (participant_frame.get("minionsKilled") or 0)
+                + (participant_frame.get("jungleMinionsKilled") or 0)
+            )
+            columns["level"].append(participant_frame.get("level") or 0)
+            columns["x"].append(position.get("x") or 0)
+            columns["y"].append(position.get("y") or 0)
+    return columns
+
+
+def _as_numpy(column: array) -> np.ndarray:
+    if not column:
+        return np.zeros(0, dtype=column.typecode)
+    return np.frombuffer(column, dtype=column.typecode)
+
+
+class FrameStore:
+    # Per-minute participant frames in typed columns. Every flush writes one
+    # uncompressed .npz segment (a .npy file per column); index.json maps each
+    # match_id to [segment, start row, row count], so one match is a slice and
+    # whole-store queries are vectorised over the concatenated columns.
+    def __init__(self, root: str, segment_rows: int = _SEGMENT_ROWS) -> None:
+        self.root = root
+        self.segment_rows = segment_rows
+        self.index_path = os.path.join(root, "index.json")
+        index: Dict[str, Any] = {"segments": [], "matches": {}}
+        if os.path.exists(self.index_path):
+            index = read_json(self.index_path)
+        self.segments: List[str] = index["segments"]
+        self.matches: Dict[str, List[int]] = index["matches"]
+        self._pending = {name: array(code) for name, code in _COLUMNS}
+        self._pending_matches: Dict[str, Tuple[int, int]] = {}
+
+    def __contains__(self, match_id: str) -> bool:
+        return match_id in self.matches or match_id in self._pending_matches
+
+    def add(self, match_id: str, columns: Dict[str, array]) -> bool:
+        if match_id in self:
+            return False
+        start = len(self._pending["minute"])
+        for name, _ in _COLUMNS:
+            self._pending[name].extend(columns[name])
+        self._pending_matches[match_id] = (start, len(columns["minute"]))
+        if len(self._pending["minute"]) >= self.segment_rows:
+            self.flush()
+        return True
+
+    def flush(self) -> None:
+        if not self._pending_matches:
+            return
+        segment = len(self.segments)
+        name = f"segment-{segment + 1:05d}.npz"
+        os.makedirs(self.root, exist_ok=True)
+        with atomic_write(os.path.join(self.root, name), "wb") as handle:
+            np.savez(
+                handle, **{key: _as_numpy(self._pending[key]) for key, _ in _COLUMNS}
+            )
+        self.segments.append(name)
+        for match_id, (start, count) in self._pending_matches.items():
+            self.matches[match_id] = [segment, start, count]
+        # The index names only finished segments.
+        write_json(
+            self.index_path,
+            {"segments": self.segments, "matches": self.matches},
+            compact=True,
+        )
+        self._pending = {key: array(code) for key, code in _COLUMNS}
+        self._pending_matches = {}
+
+    def match(self, match_id: str) -> Dict[str, np.ndarray] | None:
+        entry = self.matches.get(match_id)
+        if entry is None:
+            return None
+        segment, start, count = entry
+        with np.load(os.path.join(self.root, self.segments[segment])) as data:
+            return {name: data[name][start : start + count] for name, _ in _COLUMNS}
+
+    def load(self) -> Tuple[List[str], Dict[str, np.ndarray]]:
+        # Every flushed row, plus a "match" column indexing the returned match IDs.
+        by_segment: Dict[int, List[Tuple[int, int, str]]] = {}
+        for match_id, (segment, start, count) in self.matches.items():
+            by_segment.setdefault(segment, []).append((start, count, match_id))
+        match_ids: List[str] = []
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name, _ in _COLUMNS}
+        parts["match"] = []
+        for segment, entries in sorted(by_segment.items()):
+            entries.sort()
+            with np.load(os.path.join(self.root, self.segments[segment])) as data:
+                for name, _ in _COLUMNS:
+                    parts[name].append(data[name])
+            counts = np.array([count for _, count, _ in entries], dtype=np.int64)
+            ids = np.arange(len(match_ids), len(match_ids) + len(entries))
+            parts["match"].append(np.repeat(ids.astype(np.uint32), counts))
+            match_ids.extend(match_id for _, _, match_id in entries)
+        columns: Dict[str, np.ndarray] = {}
+        for name, code in (*_COLUMNS, ("match", "I")):
+            arrays = parts[name]
+            columns[name] = (
+                np.concatenate(arrays) if arrays else np.zeros(0, dtype=code)
+            )
+        return match_ids, columns
+
+
+def lane_gold_diff(
+    match_ids: Sequence[str],
+    columns: Dict[str, np.ndarray],
+    minutes: Sequence[int] = (10, 15),
+) -> Dict[str, np.ndarray]:
+    # Gold of every laned participant against the enemy in the same teamPosition,
+    # at each requested minute. Participants without a lane opponent are dropped.
+    results: Dict[str, List[np.ndarray]] = {name: [] for name in _DIFF_COLUMNS[:-1]}
+    for minute in minutes:
+        mask = (columns["minute"] == minute) & (columns["role"] > 0)
+        match = columns["match"][mask]
+        team = columns["team"][mask].astype(np.intp)
+        role = columns["role"][mask].astype(np.intp)
+        gold = columns["gold"][mask]
+        grid = np.full((len(match_ids), len(_TEAMS), len(_ROLES) + 1), -1, np.int64)
+        grid[match, team, role] = gold
+        opponent_gold = grid[match, 1 - team, role]
+        laned = opponent_gold >= 0
+        results["match"].append(match[laned])
+        results["participant"].append(columns["participant"][mask][laned])
+        results["team"].append(team[laned])
+        results["role"].append(role[laned])
+        results["minute"].append(np.full(int(laned.sum()), minute, np.uint16))
+        results["gold"].append(gold[laned].astype(np.int64))
+        results["opponent_gold"].append(opponent_gold[laned])
+    diff = {name: np.concatenate(arrays) for name, arrays in results.items()}
+    diff["gold_diff"] = diff["gold"] - diff["opponent_gold"]
+    return diff
+
+
+def _lane_gold_diff_rows(
+    match_ids: Sequence[str], diff: Dict[str, np.ndarray]
+) -> Iterable[Dict[str, Any]]:
+    for values in zip(*(diff[name].tolist() for name in _DIFF_COLUMNS)):
+        row = dict(zip(_DIFF_COLUMNS, values))
+        yield {
+            "match_id": match_ids[row["match"]],
+            "participant_id": row["participant"],
+            "team_id": _TEAMS[row["team"]],
+            "role": _ROLES[row["role"] - 1],
+            "minute": row["minute"],
+            "gold": row["gold"],
+            "opponent_gold": row["opponent_gold"],
+            "gold_diff": row["gold_diff"],
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Gold difference against the lane opponent from the frame store."
+    )
+    parser.add_argument("--minutes", default="10,15")
+    parser.add_argument("--store", default=FRAME_STORE_DIR)
+    args = parser.parse_args()
+    minutes = [int(minute) for minute in args.minutes.split(",") if minute]
+
+    match_ids, columns = FrameStore(args.store).load()
+    diff = lane_gold_diff(match_ids, columns, minutes)
+    path = os.path.join(CSV_DIR, "lane_gold_diff.csv")
+    write_csv(
+        path,
+        _lane_gold_diff_rows(match_ids, diff),
+        fieldnames=[
+            "match_id",
+            "participant_id",
+            "team_id",
+            "role",
+            "minute",
+            "gold",
+            "opponent_gold",
+            "gold_diff",
+        ],
+    )
+    print(
+        f"{len(diff['gold_diff'])} lane matchups from {len(match_ids)} matches "
+        f"({len(columns['minute'])} frame rows) written to {path}."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+from typing import Any, Dict, Iterable, List, Tuple
+
+from csv_exporter import write_csv
+from sqlite_store import SqliteStore
+
+
+# table -> fact_match_events columns a grid is keyed by (before cell_x, cell_y).
+# Champion grids cover every participant; player grids only tracked puuids.
+HEATMAPS: Dict[str, Tuple[str, ...]] = {
+    "agg_heatmap_champion": ("championId", "game_phase", "event"),
+    "agg_heatmap_player": ("puuid", "game_phase", "event"),
+}
+_CELL_COLUMNS = ("cell_x", "cell_y")
+
+
+class HeatmapStore:
+    # Event counts per map cell (see timeline_processing.grid_cell), one grid per
+    # champion/phase/event and per tracked puuid/phase/event. The state is a
+    # SQLite file: new matches are upserted into it and what was counted is kept
+    # alongside (match IDs for the champion grids, (match_id, puuid) pairs for the
+    # player grids), so nothing is counted twice and a run only writes the cells
+    # its matches touch. It also records the players whose grids it holds, so
+    # players tracked later can be backfilled with the matches already counted.
+    # Uncommitted counts roll back with their matches when a run fails.
+    def __init__(self, path: str, tracked: Iterable[str] = ()) -> None:
+        self.path = path
+        self.tracked = set(tracked)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        # A state saved before the counted players were recorded cannot tell which
+        # of its matches the player grids hold: those grids are emptied below and
+        # rebuilt by the backfill.
+        legacy = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'heatmap_matches' AND NOT "
+            "EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'heatmap_players')"
+        ).fetchone()
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS heatmap_matches (match_id TEXT PRIMARY KEY)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS heatmap_player_matches "
+            "(match_id TEXT, puuid TEXT, PRIMARY KEY (match_id, puuid))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS heatmap_players (puuid TEXT PRIMARY KEY)"
+        )
+        for table, columns in HEATMAPS.items():
+            key = ", ".join((*columns, *_CELL_COLUMNS))
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                f"({key}, events INTEGER NOT NULL, PRIMARY KEY ({key}))"
+            )
+        if legacy:
+            self.connection.execute("DELETE FROM agg_heatmap_player")
+        # table -> keys (without the cell) of the grids changed since the export
+        self._touched: Dict[str, set] = {table: set() for table in HEATMAPS}
+
+    def players(self) -> set:
+        return {
+            puuid
+            for (puuid,) in self.connection.execute("SELECT puuid FROM heatmap_players")
+        }
+
+    def new_players(self) -> set:
+        # Tracked players the state holds no grids for yet.
+        return self.tracked - self.players()
+
+    def counted(self, match_ids: Iterable[str]) -> List[str]:
+        return [
+            match_id
+            for match_id in sorted(set(match_ids))
+            if self.connection.execute(
+                "SELECT 1 FROM heatmap_matches WHERE match_id = ?", (match_id,)
+            ).fetchone()
+        ]
+
+    def reset(self, tracked: Iterable[str]) -> None:
+        # Empties every grid before a rebuild from all matches, whose player grids
+        # then cover `tracked`.
+        self.tracked = set(tracked)
+        for table in (
+            "heatmap_matches",
+            "heatmap_player_matches",
+            "heatmap_players",
+            *HEATMAPS,
+        ):
+            self.connection.execute(f"DELETE FROM {table}")
+        self._record_players(self.tracked)
+
+    def _record_players(self, puuids: Iterable[str]) -> None:
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO heatmap_players VALUES (?)",
+            ((puuid,) for puuid in puuids),
+        )
+
+    def _count(self, table: str, rows: Iterable[Dict[str, Any]]) -> None:
+        columns = HEATMAPS[table]
+        counts: Dict[Tuple[Any, ...], int] = {}
+        for row in rows:
+            key = tuple(row.get(column) for column in (*columns, *_CELL_COLUMNS))
+            counts[key] = counts.get(key, 0) + 1
+        if not counts:
+            return
+        key_columns = ", ".join((*columns, *_CELL_COLUMNS))
+        placeholders = ", ".join("?" for _ in range(len(columns) + 3))
+        self.connection.executemany(
+            f"INSERT INTO {table} ({key_columns}, events) VALUES ({placeholders}) "
+            f"ON CONFLICT ({key_columns}) DO UPDATE SET "
+            "events = events + excluded.events",
+            ((*key, events) for key, events in counts.items()),
+        )
+        self._touched[table].update(key[: len(columns)] for key in counts)
+
+    def _add_players(
+        self, match_id: str, rows: List[Dict[str, Any]], puuids: set
+    ) -> int:
+        # Each of the match's players in `puuids` is counted once, the first time
+        # the match is seen with them tracked. Returns the rows counted.
+        new = {
+            puuid
+            for puuid in {row.get("puuid") for row in rows} & puuids
+            if self.connection.execute(
+                "INSERT OR IGNORE INTO heatmap_player_matches VALUES (?, ?)",
+                (match_id, puuid),
+            ).rowcount
+        }
+        counted = [row for row in rows if row.get("puuid") in new]
+        self._count("agg_heatmap_player", counted)
+        return len(counted)
+
+    def add(self, match_id: str, rows: Iterable[Dict[str, Any]]) -> None:
+        rows = list(rows)
+        inserted = self.connection.execute(
+            "INSERT OR IGNORE INTO heatmap_matches VALUES (?)", (match_id,)
+        )
+        if inserted.rowcount:
+            self._count("agg_heatmap_champion", rows)
+        self._add_players(match_id, rows, self.tracked)
+
+    def backfill(
+        self, matches: Iterable[Tuple[str, List[Dict[str, Any]]]]
+    ) -> int:
+        # Counts the fact_match_events rows of already counted matches for the
+        # tracked players new to the state, then records them. Returns the rows
+        # counted.
+        new = self.new_players()
+        counted = sum(
+            self._add_players(match_id, rows, new) for match_id, rows in matches
+        )
+        self._record_players(new)
+        return counted
+
+    def rows(self, table: str) -> List[Dict[str, Any]]:
+        columns = (*HEATMAPS[table], *_CELL_COLUMNS, "events")
+        cursor = self.connection.execute(
+            f"SELECT {', '.join(columns)} FROM {table} ORDER BY {', '.join(columns)}"
+        )
+        return [dict(zip(columns, values)) for values in cursor]
+
+    def _touched_rows(self, table: str) -> List[Dict[str, Any]]:
+        # Grid lookups are primary-key prefix scans.
+        columns = (*HEATMAPS[table], *_CELL_COLUMNS, "events")
+        query = (
+            f"SELECT {', '.join(columns)} FROM {table} WHERE "
+            + " AND ".join(f"{column} = ?" for column in HEATMAPS[table])
+        )
+        return [
+            dict(zip(columns, values))
+            for key in sorted(self._touched[table], key=repr)
+            for values in self.connection.execute(query, key)
+        ]
+
+    def save(self) -> None:
+        self.connection.commit()
+
+    def export(self, csv_dir: str, store: SqliteStore | None = None) -> None:
+        # The CSVs hold every cell; the SQLite star schema only receives the grids
+        # this run changed.
+        for table, columns in HEATMAPS.items():
+            write_csv(
+                os.path.join(csv_dir, f"{table}.csv"),
+                self.rows(table),
+                fieldnames=[*columns, *_CELL_COLUMNS, "events"],
+            )
+            if store is not None:
+                store.load(table, self._touched_rows(table), replace=True)
+            self._touched[table] = set()
+        self.save()
+
+    def close(self) -> None:
+        self.connection.close()
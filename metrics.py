@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+from storage import atomic_write, write_json
+
+
+# Upper bounds (seconds) of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        # Prometheus-style (le, cumulative count) pairs ending with +Inf.
+        pairs: List[Tuple[str, int]] = []
+        total = 0
+        for bound, count in zip((*map(str, self.bounds), "+Inf"), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+def _escape(value: Any) -> str:
+    return (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def _labels(**labels: Any) -> str:
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+class Metrics:
+    # Thread-safe counters for one run: Riot API traffic per endpoint (the
+    # RiotClient `method` names) and wall time / rows per pipeline stage.
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests: Dict[Tuple[str, int], int] = {}
+        self.latency: Dict[str, Histogram] = {}
+        self.parse_seconds: Dict[str, float] = {}
+        self.bytes_received: Dict[str, int] = {}
+        self.throttled: Dict[Tuple[str, str], int] = {}
+        self.wait_seconds: Dict[str, float] = {}
+        # (scope, routing, endpoint, window seconds) -> requests left in the window
+        self.remaining: Dict[Tuple[str, str, str, int], int] = {}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.table_rows: Dict[str, int] = {}
+
+    def observe_request(
+        self, endpoint: str, status: int, seconds: float, size: int
+    ) -> None:
+        with self._lock:
+            key = (endpoint, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = Histogram()
+            histogram.observe(seconds)
+            self.bytes_received[endpoint] = self.bytes_received.get(endpoint, 0) + size
+
+    def add_parse_time(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            previous = self.parse_seconds.get(endpoint, 0.0)
+            self.parse_seconds[endpoint] = previous + seconds
+
+    def observe_throttle(self, endpoint: str, limit_type: str) -> None:
+        with self._lock:
+            key = (endpoint, limit_type or "service")
+            self.throttled[key] = self.throttled.get(key, 0) + 1
+
+    def observe_wait(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            self.wait_seconds[endpoint] = self.wait_seconds.get(endpoint, 0.0) + seconds
+
+    def observe_budget(
+        self, scope: str, routing: str, endpoint: str, window: int, remaining: int
+    ) -> None:
+        with self._lock:
+            self.remaining[(scope, routing, endpoint, window)] = remaining
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - started)
+
+    def add_stage_time(self, name: str, seconds: float) -> None:
+        with self._lock:
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "rows": 0})
+            stage["seconds"] += seconds
+
+    def add_rows(self, name: str, rows: int, table: str | None = None) -> None:
+        with self._lock:
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "rows": 0})
+            stage["rows"] += rows
+            if table is not None:
+                self.table_rows[table] = self.table_rows.get(table, 0) + rows
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints: Dict[str, Dict[str, Any]] = {}
+            for (endpoint, status), count in sorted(self.requests.items()):
+                entry = endpoints.setdefault(endpoint, {"requests": {}})
+                entry["requests"][str(status)] = count
+            for endpoint, entry in endpoints.items():
+                histogram = self.latency[endpoint]
+                entry["latency_seconds"] = {
+                    "count": histogram.count,
+                    "sum": round(histogram.sum, 6),
+                    "buckets": dict(histogram.cumulative()),
+                }
+                entry["parse_seconds"] = round(self.parse_seconds.get(endpoint, 0.0), 6)
+                entry["bytes_received"] = self.bytes_received.get(endpoint, 0)
+                entry["rate_limit_wait_seconds"] = round(
+                    self.wait_seconds.get(endpoint, 0.0), 6
+                )
+                entry["throttled"] = {
+                    limit_type: count
+                    for (name, limit_type), count in sorted(self.throttled.items())
+                    if name == endpoint
+                }
+            return {
+                "started_at": self.started_at,
+                "finished_at": time.time(),
+                "endpoints": endpoints,
+                "rate_limit_remaining": [
+                    {
+                        "scope": scope,
+                        "routing": routing,
+                        "endpoint": endpoint,
+                        "window_seconds": window,
+                        "remaining": remaining,
+                    }
+                    for (scope, routing, endpoint, window), remaining in sorted(
+                        self.remaining.items()
+                    )
+                ],
+                "stages": {
+                    name: {"seconds": round(stage["seconds"], 6), "rows": stage["rows"]}
+                    for name, stage in self.stages.items()
+                },
+                "table_rows": dict(sorted(self.table_rows.items())),
+            }
+
+    def prometheus(self) -> str:
+        report = self.report()
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        metric("riot_api_requests_total", "counter", "Riot API responses by status.")
+        for endpoint, entry in report["endpoints"].items():
+            for status, count in entry["requests"].items():
+                labels = _labels(endpoint=endpoint, status=status)
+                lines.append(f"riot_api_requests_total{labels} {count}")
+        metric(
+            "riot_api_request_duration_seconds",
+            "histogram",
+            "Riot API request latency.",
+        )
+        for endpoint, entry in report["endpoints"].items():
+            latency = entry["latency_seconds"]
+            for bound, count in latency["buckets"].items():
+                lines.append(
+                    "riot_api_request_duration_seconds_bucket"
+                    f"{_labels(endpoint=endpoint, le=bound)} {count}"
+                )
+            lines.append(
+                f"riot_api_request_duration_seconds_sum{_labels(endpoint=endpoint)}"
+                f" {latency['sum']}"
+            )
+            lines.append(
+                f"riot_api_request_duration_seconds_count{_labels(endpoint=endpoint)}"
+                f" {latency['count']}"
+            )
+        for name, key, help_text in (
+            ("riot_api_response_bytes_total", "bytes_received", "Response bytes."),
+            ("riot_api_parse_seconds_total", "parse_seconds", "JSON decode time."),
+            (
+                "riot_api_rate_limit_wait_seconds_total",
+                "rate_limit_wait_seconds",
+                "Time spent waiting for the local rate limiter.",
+            ),
+        ):
+            metric(name, "counter", help_text)
+            for endpoint, entry in report["endpoints"].items():
+                lines.append(f"{name}{_labels(endpoint=endpoint)} {entry[key]}")
+        metric("riot_api_throttled_total", "counter", "429 responses by limit type.")
+        for endpoint, entry in report["endpoints"].items():
+            for limit_type, count in entry["throttled"].items():
+                labels = _labels(endpoint=endpoint, limit_type=limit_type)
+                lines.append(f"riot_api_throttled_total{labels} {count}")
+        metric(
+            "riot_api_rate_limit_remaining",
+            "gauge",
+            "Requests left in each rate-limit window at the last response.",
+        )
+        for entry in report["rate_limit_remaining"]:
+            labels = _labels(
+                scope=entry["scope"],
+                routing=entry["routing"],
+                endpoint=entry["endpoint"],
+                window=entry["window_seconds"],
+            )
+            lines.append(f"riot_api_rate_limit_remaining{labels} {entry['remaining']}")
+        metric("pipeline_stage_seconds", "gauge", "Wall time per pipeline stage.")
+        for stage, entry in report["stages"].items():
+            labels = _labels(stage=stage)
+            lines.append(f"pipeline_stage_seconds{labels} {entry['seconds']}")
+        metric("pipeline_stage_rows", "gauge", "Rows produced per pipeline stage.")
+        for stage, entry in report["stages"].items():
+            lines.append(f"pipeline_stage_rows{_labels(stage=stage)} {entry['rows']}")
+        metric("pipeline_table_rows", "gauge", "Rows written per output table.")
+        for table, rows in report["table_rows"].items():
+            lines.append(f"pipeline_table_rows{_labels(table=table)} {rows}")
+        metric(
+            "pipeline_last_run_timestamp_seconds",
+            "gauge",
+            "Unix time the last run finished.",
+        )
+        lines.append(f"pipeline_last_run_timestamp_seconds {report['finished_at']:.3f}")
+        metric("pipeline_last_run_duration_seconds", "gauge", "Wall time of the run.")
+        lines.append(
+            "pipeline_last_run_duration_seconds "
+            f"{report['finished_at'] - report['started_at']:.3f}"
+        )
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_path: str, prometheus_path: str) -> None:
+        if json_path:
+            write_json(json_path, self.report())
+        if prometheus_path:
+            # The textfile collector may read at any time; atomic_write renames
+            # the finished file into place.
+            with atomic_write(prometheus_path, "w", encoding="utf-8") as handle:
+                handle.write(self.prometheus())
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+from csv_exporter import StreamingCsvWriter, read_csv
+from storage import read_json, write_json
+
+
+_MANIFEST_NAME = "_manifest.json"
+_UNKNOWN_PARTITION = ("unknown", "unknown")
+
+
+def _partition_of(datetime_utc: str) -> Tuple[str, str]:
+    # format_unix_ms output: "YYYY-MM-DD HH:MM:SS".
+    if len(datetime_utc) < 7:
+        return _UNKNOWN_PARTITION
+    return datetime_utc[:4], datetime_utc[5:7]
+
+
+def read_manifest(table_dir: str) -> Dict[str, List[str]]:
+    path = os.path.join(table_dir, _MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    return read_json(path).get("partitions", {})
+
+
+def read_partitions(root: str, table: str) -> Iterator[Dict[str, str]]:
+    # Rows of the part files the manifest lists, i.e. what readers should see.
+    table_dir = os.path.join(root, table)
+    for relative in sorted(read_manifest(table_dir)):
+        yield from read_csv(os.path.join(table_dir, relative))
+
+
+def _remove_orphans(table_dir: str, manifest: Dict[str, List[str]]) -> None:
+    # Part files are published before the manifest, so a crash in between leaves
+    # parts the manifest does not list; their matches are written again.
+    # Staging files of an aborted run go as well.
+    if not os.path.isdir(table_dir):
+        return
+    for directory, _, names in os.walk(table_dir):
+        for name in names:
+            path = os.path.join(directory, name)
+            if name.startswith(("part-", ".part-")) and (
+                os.path.relpath(path, table_dir) not in manifest
+            ):
+                os.remove(path)
+
+
+class PartitionWriter:
+    # Partitions are immutable: matches already listed in the manifest are skipped
+    # and new rows always stream into fresh part files. Part files missing from
+    # the manifest are removed on start.
+    def __init__(self, root: str, table: str, key: str = "match_id") -> None:
+        self.table_dir = os.path.join(root, table)
+        self.key = key
+        self.manifest = read_manifest(self.table_dir)
+        _remove_orphans(self.table_dir, self.manifest)
+        self.known = {
+            match_id for match_ids in self.manifest.values() for match_id in match_ids
+        }
+        self.row_count = 0
+        self._stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        self._writers: Dict[Tuple[str, str], Tuple[str, StreamingCsvWriter]] = {}
+        self._match_ids: Dict[str, Set[str]] = {}
+
+    def _writer(self, partition: Tuple[str, str]) -> Tuple[str, StreamingCsvWriter]:
+        entry = self._writers.get(partition)
+        if entry is not None:
+            return entry
+        year, month = partition
+        directory = os.path.join(f"year={year}", f"month={month}")
+        relative = os.path.join(directory, f"part-{self._stamp}.csv")
+        suffix = 1
+        while relative in self.manifest:
+            relative = os.path.join(directory, f"part-{self._stamp}-{suffix}.csv")
+            suffix += 1
+        writer = StreamingCsvWriter(os.path.join(self.table_dir, relative))
+        entry = self._writers[partition] = (relative, writer)
+        self._match_ids[relative] = set()
+        return entry
+
+    def writerows(
+        self, rows: Iterable[Dict[str, Any]], datetime_utc: str
+    ) -> List[Dict[str, Any]]:
+        # Returns the rows actually written (not already in the manifest).
+        partition = _partition_of(datetime_utc)
+        written: List[Dict[str, Any]] = []
+        for row in rows:
+            match_id = str(row.get(self.key, ""))
+            if match_id in self.known:
+                continue
+            relative, writer = self._writer(partition)
+            writer.writerow(row)
+            self._match_ids[relative].add(match_id)
+            self.row_count += 1
+            written.append(row)
+        return written
+
+    def prepare(self) -> None:
+        for _, writer in self._writers.values():
+            writer.prepare()
+
+    def close(self) -> None:
+        if not self._writers:
+            return
+        self.prepare()
+        for relative, writer in self._writers.values():
+            writer.publish()
+            self.manifest[relative] = sorted(self._match_ids[relative])
+        # The manifest is written last so a crash never lists a missing part file.
+        write_json(
+            os.path.join(self.table_dir, _MANIFEST_NAME), {"partitions": self.manifest}
+        )
+
+    def abort(self) -> None:
+        for _, writer in self._writers.values():
+            writer.abort()
+
+    def __enter__(self) -> "PartitionWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
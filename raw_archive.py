@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import gzip
+import json
+import lzma
+import os
+import threading
+from typing import Any, Dict, List, Tuple
+
+from storage import atomic_write, read_json, write_json
+
+
+# format -> file suffix for the one-file-per-payload formats.
+_SUFFIXES = {"json": ".json", "gzip": ".json.gz", "lzma": ".json.xz"}
+FORMATS = (*_SUFFIXES, "pack")
+_PACK_DIR = "pack"
+_PACK_INDEX = "index.json"
+_SEGMENT_MAX_BYTES = 256 * 1024 * 1024
+
+# (path, format, offset, length); offset/length only matter for packs.
+Location = Tuple[str, str, int, int]
+
+
+def _dumps(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
+
+
+def read_location(location: Location) -> Any:
+    # Module-level so worker processes can load a payload from a bare location.
+    path, fmt, offset, length = location
+    if fmt == "pack":
+        with open(path, "rb") as handle:
+            handle.seek(offset)
+            return json.loads(handle.read(length))
+    if fmt == "gzip":
+        with gzip.open(path, "rb") as handle:
+            return json.loads(handle.read())
+    if fmt == "lzma":
+        with lzma.open(path, "rb") as handle:
+            return json.loads(handle.read())
+    return read_json(path)
+
+
+class _Pack:
+    # Append-only JSON-lines segments plus an offset index by key. Records are
+    # appended under a lock; the index is published atomically on flush, so bytes
+    # written after the last flush are simply unreferenced after a crash.
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.index_path = os.path.join(directory, _PACK_INDEX)
+        self.index: Dict[str, List[Any]] = (
+            read_json(self.index_path) if os.path.exists(self.index_path) else {}
+        )
+        self._lock = threading.Lock()
+        self._dirty = False
+        segments: List[str] = []
+        if os.path.isdir(directory):
+            segments = sorted(
+                name for name in os.listdir(directory) if name.startswith("segment-")
+            )
+        self._segment = segments[-1] if segments else self._segment_name(1)
+
+    @staticmethod
+    def _segment_name(number: int) -> str:
+        return f"segment-{number:05d}.jsonl"
+
+    def append(self, key: str, payload: Any) -> None:
+        record = _dumps(payload)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, self._segment)
+            if os.path.exists(path) and os.path.getsize(path) >= _SEGMENT_MAX_BYTES:
+                number = int(self._segment[len("segment-") : -len(".jsonl")]) + 1
+                self._segment = self._segment_name(number)
+                path = os.path.join(self.directory, self._segment)
+            with open(path, "ab") as handle:
+                offset = handle.tell()
+                handle.write(record + b"\n")
+            self.index[key] = [self._segment, offset, len(record)]
+            self._dirty = True
+
+    def locate(self, key: str) -> Location | None:
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        segment, offset, length = entry
+        return os.path.join(self.directory, segment), "pack", offset, length
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._dirty:
+                write_json(self.index_path, self.index, compact=True)
+                self._dirty = False
+
+
+class RawArchive:
+    # Stores immutable payloads (matches, timelines) as compact JSON in `fmt`.
+    # Reads accept every format, so archives written with an older RAW_FORMAT
+    # (including the original indented .json files) stay readable.
+    def __init__(self, root: str, fmt: str = "gzip") -> None:
+        if fmt not in FORMATS:
+            raise ValueError(
+                f"Unknown raw format '{fmt}'; expected one of {', '.join(FORMATS)}."
+            )
+        self.root = root
+        self.fmt = fmt
+        self._packs: Dict[str, _Pack] = {}
+        self._lock = threading.Lock()
+
+    def _pack(self, kind: str) -> _Pack:
+        with self._lock:
+            pack = self._packs.get(kind)
+            if pack is None:
+                pack = self._packs[kind] = _Pack(
+                    os.path.join(self.root, kind, _PACK_DIR)
+                )
+            return pack
+
+    def _path(self, kind: str, key: str, fmt: str) -> str:
+        return os.path.join(self.root, kind, f"{key}{_SUFFIXES[fmt]}")
+
+    def locate(self, kind: str, key: str) -> Location | None:
+        location = self._pack(kind).locate(key)
+        if location is not None and self.fmt == "pack":
+            return location
+        # The configured format first, then whatever older runs left behind.
+        for fmt in sorted(_SUFFIXES, key=lambda name: name != self.fmt):
+            path = self._path(kind, key, fmt)
+            if os.path.exists(path):
+                return path, fmt, 0, 0
+        return location
+
+    def read(self, kind: str, key: str) -> Any:
+        location = self.locate(kind, key)
+        if location is None:
+            raise KeyError(f"{kind}/{key} is not archived.")
+        return read_location(location)
+
+    def write(self, kind: str, key: str, payload: Any) -> None:
+        if self.fmt == "pack":
+            self._pack(kind).append(key, payload)
+            return
+        path = self._path(kind, key, self.fmt)
+        if self.fmt == "gzip":
+            # Level 6 keeps most of the size win at a fraction of level 9's cost.
+            with atomic_write(path, "wb") as handle:
+                handle.write(gzip.compress(_dumps(payload), compresslevel=6))
+        elif self.fmt == "lzma":
+            with atomic_write(path, "wb") as handle:
+                handle.write(lzma.compress(_dumps(payload), preset=1))
+        else:
+            with atomic_write(path, "wb") as handle:
+                handle.write(_dumps(payload))
+
+    def keys(self, kind: str) -> List[str]:
+        keys = dict.fromkeys(self._pack(kind).index)
+        directory = os.path.join(self.root, kind)
+        if os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                for suffix in _SUFFIXES.values():
+                    if name.endswith(suffix) and not name.startswith("."):
+                        keys.setdefault(name[: -len(suffix)])
+                        break
+        return list(keys)
+
+    def flush(self) -> None:
+        with self._lock:
+            packs = list(self._packs.values())
+        for pack in packs:
+            pack.flush()
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import argparse
+import os
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from config import (
+    CSV_DIR,
+    DATA_DIR,
+    DDRAGON_DIR,
+    FRAME_STORE_DIR,
+    HEATMAP_STATE_PATH,
+    RAW_FORMAT,
+    REPLAY_WORKERS,
+    ROLLUP_STATE_PATH,
+)
+from csv_exporter import write_data_as_csv
+from ddragon import cached_versions, resolve_version
+from frame_store import FrameStore, extract_frames
+from heatmaps import HeatmapStore
+from raw_archive import Location, RawArchive, read_location
+from rollups import RollupStore
+from sinks import TableSink
+from storage import read_json
+from transform import MATCH_CHILD_TABLES, TIMELINE_TABLES, transform_match
+
+
+_ALLOWED_QUEUES = {420, 440}
+# Matches per worker task: enough to amortise IPC, small enough that the chunks in
+# flight stay a bounded amount of memory.
+_CHUNK_SIZE = 16
+_PROFILE_FILES = ("account", "summoner", "league_entries", "champion_mastery")
+
+
+def _archived_matches(root: str) -> List[Tuple[str, Location, Location]]:
+    archive = RawArchive(root, RAW_FORMAT)
+    archived: List[Tuple[str, Location, Location]] = []
+    for match_id in sorted(archive.keys("matches")):
+        match_location = archive.locate("matches", match_id)
+        timeline_location = archive.locate("match_timelines", match_id)
+        if match_location is not None and timeline_location is not None:
+            archived.append((match_id, match_location, timeline_location))
+    return archived
+
+
+def _replay_match(
+    ddragon_versions: List[str],
+    with_frames: bool,
+    item: Tuple[str, Location, Location],
+) -> Tuple[str, str, Dict[str, List[Dict[str, Any]]], Dict[str, Any] | None] | None:
+    # Runs in a worker process: decompression, JSON parsing and the transforms are
+    # the CPU cost; packs are read by offset, never unpacked whole.
+    match_id, match_location, timeline_location = item
+    match = read_location(match_location)
+    if match.get("info", {}).get("queueId") not in _ALLOWED_QUEUES:
+        return None
+    ddragon_version = resolve_version(
+        match.get("info", {}).get("gameVersion", ""), ddragon_versions
+    )
+    timeline = read_location(timeline_location)
+    datetime_utc, tables = transform_match(match_id, match, timeline, ddragon_version)
+    frames = None
+    if with_frames:
+        frames = extract_frames(
+            timeline.get("info", {}).get("frames", []),
+            match.get("info", {}).get("participants", []),
+        )
+    return match_id, datetime_utc, tables, frames
+
+
+def _replay_chunk(
+    replay_match: Callable[[Tuple[str, Location, Location]], Any],
+    items: Sequence[Tuple[str, Location, Location]],
+) -> List[Any]:
+    return [replay_match(item) for item in items]
+
+
+def _replayed(
+    executor: Executor,
+    replay_match: Callable[[Tuple[str, Location, Location]], Any],
+    archived: Sequence[Tuple[str, Location, Location]],
+    max_workers: int,
+) -> Iterator[Any]:
+    # Results come back in archive order. At most two chunks per worker are
+    # submitted ahead of the consumer, as in riot.fetch_many, so slow sinks hold
+    # a bounded number of transformed matches instead of the whole archive.
+    pending: Deque[Future] = deque()
+    for start in range(0, len(archived), _CHUNK_SIZE):
+        chunk = archived[start : start + _CHUNK_SIZE]
+        pending.append(executor.submit(_replay_chunk, replay_match, chunk))
+        if len(pending) >= 2 * max_workers:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+def replay(
+    root: str = DATA_DIR,
+    max_workers: int = REPLAY_WORKERS,
+    tracked: Iterable[str] | None = None,
+) -> int:
+    archived = _archived_matches(root)
+    max_workers = max_workers or os.cpu_count() or 1
+    replayed = 0
+    with ExitStack() as stack:
+        sinks = {
+            "matches": stack.enter_context(
+                TableSink("matches", "matchId", partitioned=False)
+            ),
+            "fact_match_player": stack.enter_context(
+                TableSink("fact_match_player", partitioned=False)
+            ),
+        }
+        for table in (*MATCH_CHILD_TABLES, *TIMELINE_TABLES):
+            sinks[table] = stack.enter_context(TableSink(table, partitioned=False))
+        executor = stack.enter_context(ProcessPoolExecutor(max_workers=max_workers))
+        # The frame store is append-only: matches it already holds are skipped.
+        frame_store = FrameStore(FRAME_STORE_DIR) if FRAME_STORE_DIR else None
+        # fact_match_player.csv is rebuilt from scratch, and so are the rollups.
+        rollups = RollupStore(ROLLUP_STATE_PATH) if ROLLUP_STATE_PATH else None
+        if rollups is not None:
+            rollups.reset()
+        # The event tables are rebuilt too, so the heatmap cells start over. Player
+        # grids cover `tracked`, by default the players the state already held.
+        heatmaps = HeatmapStore(HEATMAP_STATE_PATH) if HEATMAP_STATE_PATH else None
+        if heatmaps is not None:
+            heatmaps.reset(heatmaps.players() if tracked is None else tracked)
+        # Versions come from the local Data Dragon cache; replay stays offline.
+        replay_match = partial(
+            _replay_match, cached_versions(DDRAGON_DIR), frame_store is not None
+        )
+        for result in _replayed(executor, replay_match, archived, max_workers):
+            if result is None:
+                continue
+            match_id, datetime_utc, tables, frames = result
+            for table, rows in tables.items():
+                sinks[table].write(rows, datetime_utc)
+            if rollups is not None:
+                rollups.add(tables["fact_match_player"])
+            if heatmaps is not None:
+                heatmaps.add(match_id, tables["fact_match_events"])
+            if frame_store is not None:
+                frame_store.add(match_id, frames)
+            replayed += 1
+        if frame_store is not None:
+            frame_store.flush()
+    if rollups is not None:
+        rollups.export(CSV_DIR)
+    if heatmaps is not None:
+        heatmaps.export(CSV_DIR)
+        heatmaps.close()
+
+    for name in _PROFILE_FILES:
+        path = os.path.join(root, f"{name}.json")
+        if os.path.exists(path):
+            write_data_as_csv(os.path.join(CSV_DIR, f"{name}.csv"), read_json(path))
+    return replayed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Rebuild the CSVs from the archived matches and timelines."
+    )
+    parser.add_argument(
+        "--puuid",
+        action="append",
+        help="player to build heatmap grids for (repeatable); by default the "
+        "players the heatmap state already covers",
+    )
+    args = parser.parse_args()
+    replayed = replay(tracked=args.puuid)
+    print(f"Replayed {replayed} matches from {DATA_DIR} into {CSV_DIR}.")
+
+
+if __name__ == "__main__":
+    main()
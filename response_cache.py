@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from riot import (
+    RiotClient,
+    get_account_by_riot_id,
+    get_champion_mastery_by_puuid,
+    get_league_entries_by_summoner_id,
+    get_match,
+    get_match_timeline,
+    get_summoner_by_puuid,
+)
+from raw_archive import RawArchive, read_location
+from storage import read_json, write_json
+
+
+# Finished matches never change, so these live in the raw tree for good.
+_IMMUTABLE_KINDS = ("matches", "match_timelines")
+# Match fields copied into the index entry of every cached match.
+_META_FIELDS = ("queueId", "gameStartTimestamp", "gameVersion")
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        root: str,
+        max_entries: int = 256,
+        ttl_seconds: float = 900,
+        raw_format: str = "gzip",
+    ) -> None:
+        self.root = root
+        self.archive = RawArchive(root, raw_format)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.index_path = os.path.join(root, "cache_index.json")
+        self.api_calls = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        if os.path.exists(self.index_path):
+            self.index: Dict[str, Dict[str, Any]] = read_json(self.index_path)
+        else:
+            self.index = self._scan()
+        for kind in (*_IMMUTABLE_KINDS, "mutable"):
+            self.index.setdefault(kind, {})
+
+    def _scan(self) -> Dict[str, Dict[str, Any]]:
+        # One-off seeding from raw files written before the index existed.
+        index: Dict[str, Dict[str, Any]] = {}
+        for kind in _IMMUTABLE_KINDS:
+            index[kind] = {key: {} for key in self.archive.keys(kind)}
+        self._dirty = True
+        return index
+
+    def _immutable(
+        self, kind: str, match_id: str, fetch: Callable[[], Any]
+    ) -> Any:
+        indexed = match_id in self.index[kind]
+        location = self.archive.locate(kind, match_id)
+        if location is not None:
+            if not indexed:
+                # Written by a run that stopped before saving the index.
+                with self._lock:
+                    self.index[kind][match_id] = {}
+                    self._dirty = True
+            return read_location(location)
+        payload = fetch()
+        self.archive.write(kind, match_id, payload)
+        with self._lock:
+            self.api_calls += 1
+            self.index[kind][match_id] = {}
+            self._dirty = True
+        return payload
+
+    def _mutable(self, key: str, fetch: Callable[[], Any]) -> Any:
+        now = time.time()
+        entries = self.index["mutable"]
+        entry = entries.get(key)
+        if entry is not None and now - entry["fetched_at"] < self.ttl_seconds:
+            path = os.path.join(self.root, entry["path"])
+            if os.path.exists(path):
+                with self._lock:
+                    entry["used_at"] = now
+                    self._dirty = True
+                return read_json(path)
+        payload = fetch()
+        relative = os.path.join("cache", f"{key.replace('/', '_')}.json")
+        write_json(os.path.join(self.root, relative), payload)
+        with self._lock:
+            self.api_calls += 1
+            entries[key] = {"path": relative, "fetched_at": now, "used_at": now}
+            self._evict()
+            self._dirty = True
+        return payload
+
+    def _evict(self) -> None:
+        entries = self.index["mutable"]
+        overflow = len(entries) - self.max_entries
+        if overflow <= 0:
+            return
+        oldest = sorted(entries, key=lambda key: entries[key]["used_at"])[:overflow]
+        for key in oldest:
+            path = os.path.join(self.root, entries.pop(key)["path"])
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _remember_meta(self, match_id: str, match: Dict) -> Dict[str, Any]:
+        # queueId/gameStartTimestamp/gameVersion ride along in the index so
+        # discovery can filter, sort and resolve patches for known matches without
+        # opening their payloads.
+        info = match.get("info", {})
+        with self._lock:
+            entry = self.index["matches"].setdefault(match_id, {})
+            if "gameVersion" not in entry:
+                for field in _META_FIELDS:
+                    entry[field] = info.get(field)
+                self._dirty = True
+            return entry
+
+    def match(self, client: RiotClient, match_id: str) -> Dict:
+        match = self._immutable(
+            "matches", match_id, lambda: get_match(client, match_id)
+        )
+        self._remember_meta(match_id, match)
+        return match
+
+    def match_meta(self, match_id: str) -> Dict[str, Any] | None:
+        entry = self.index["matches"].get(match_id)
+        # Entries written before gameVersion was indexed are refreshed from disk.
+        if entry is not None and "gameVersion" in entry:
+            return entry
+        location = self.archive.locate("matches", match_id)
+        if location is None:
+            return None
+        return self._remember_meta(match_id, read_location(location))
+
+    def timeline(self, client: RiotClient, match_id: str) -> Dict:
+        return self._immutable(
+            "match_timelines", match_id, lambda: get_match_timeline(client, match_id)
+        )
+
+    def account(self, client: RiotClient, game_name: str, tag_line: str) -> Dict:
+        return self._mutable(
+            f"account/{game_name}#{tag_line}",
+            lambda: get_account_by_riot_id(client, game_name, tag_line),
+        )
+
+    def summoner(self, client: RiotClient, puuid: str) -> Dict:
+        return self._mutable(
+            f"summoner/{puuid}", lambda: get_summoner_by_puuid(client, puuid)
+        )
+
+    def league_entries(self, client: RiotClient, summoner_id: str) -> list:
+        return self._mutable(
+            f"league_entries/{summoner_id}",
+            lambda: get_league_entries_by_summoner_id(client, summoner_id),
+        )
+
+    def champion_mastery(self, client: RiotClient, puuid: str) -> list:
+        return self._mutable(
+            f"champion_mastery/{puuid}",
+            lambda: get_champion_mastery_by_puuid(client, puuid),
+        )
+
+    def save(self) -> None:
+        # Pack indexes first, so the cache index never names an unreachable record.
+        self.archive.flush()
+        with self._lock:
+            if not self._dirty:
+                return
+            write_json(self.index_path, self.index, compact=True)
+            self._dirty = False
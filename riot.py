@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import Metrics
+
+
+# Riot development-key defaults; replaced by the X-*-Rate-Limit headers as soon as
+# the first response arrives.
+_DEFAULT_APP_LIMITS = "20:1,100:120"
+_DEFAULT_METHOD_LIMITS = "20:1,100:120"
+# Safety margin added to every window to absorb clock skew against Riot's servers.
+_WINDOW_MARGIN_S = 0.1
+
+
+def _parse_limits(header: str | None) -> List[Tuple[int, int]]:
+    limits: List[Tuple[int, int]] = []
+    if not header:
+        return limits
+    for part in header.split(","):
+        try:
+            count, window = part.split(":")
+            limits.append((int(count), int(window)))
+        except ValueError:
+            continue
+    return limits
+
+
+class _TokenBucket:
+    # Each consumed token is refunded `window` seconds later, so no window of that
+    # length ever sees more than `limit` requests (matching Riot's fixed windows).
+    def __init__(self, limit: int, window: int) -> None:
+        self.limit = limit
+        self.seconds = window
+        self.window = window + _WINDOW_MARGIN_S
+        self.refunds: Deque[float] = deque()
+
+    def _expire(self, now: float) -> None:
+        while self.refunds and self.refunds[0] <= now:
+            self.refunds.popleft()
+
+    def wait_time(self, now: float) -> float:
+        self._expire(now)
+        if len(self.refunds) < self.limit:
+            return 0.0
+        return self.refunds[0] - now
+
+    def consume(self, now: float) -> None:
+        self.refunds.append(now + self.window)
+
+    def sync(self, used: int, now: float) -> None:
+        # The server counted more requests than we did (other processes, restarts);
+        # assume the extra ones were just made.
+        self._expire(now)
+        for _ in range(used - len(self.refunds)):
+            self.refunds.append(now + self.window)
+
+    def block(self, until: float) -> None:
+        self.refunds = deque([until] * self.limit)
+
+
+class RateLimiter:
+    def __init__(self, spec: str) -> None:
+        self.spec = ""
+        self.buckets: List[_TokenBucket] = []
+        self.update(spec, None, time.monotonic())
+
+    def wait_time(self, now: float) -> float:
+        return max((bucket.wait_time(now) for bucket in self.buckets), default=0.0)
+
+    def consume(self, now: float) -> None:
+        for bucket in self.buckets:
+            bucket.consume(now)
+
+    def update(self, spec: str | None, counts: str | None, now: float) -> None:
+        if spec and spec != self.spec:
+            previous = {bucket.seconds: bucket for bucket in self.buckets}
+            buckets = []
+            for limit, window in _parse_limits(spec):
+                bucket = _TokenBucket(limit, window)
+                existing = previous.get(window)
+                if existing is not None:
+                    bucket.refunds = existing.refunds
+                buckets.append(bucket)
+            self.spec = spec
+            self.buckets = buckets
+        by_window = {window: used for used, window in _parse_limits(counts)}
+        for bucket in self.buckets:
+            used = by_window.get(bucket.seconds)
+            if used is not None:
+                bucket.sync(used, now)
+
+    def block(self, seconds: float, now: float) -> None:
+        for bucket in self.buckets:
+            bucket.block(now + seconds)
+
+
+class RiotClient:
+    def __init__(
+        self,
+        api_key: str,
+        platform_routing: str,
+        regional_routing: str,
+        timeout: float = 20,
+        max_retries: int = 5,
+        metrics: Metrics | None = None,
+        base_url: str = "",
+    ) -> None:
+        self.api_key = api_key
+        self.metrics = metrics
+        self.platform_routing = platform_routing
+        self.regional_routing = regional_routing
+        self.timeout = timeout
+        self.max_retries = max_retries
+        # Overrides https://{routing}.api.riotgames.com, e.g. a local stand-in.
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers.update({"X-Riot-Token": api_key})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        # App limits apply per routing value; method limits per routing and endpoint.
+        self._app_limiters: Dict[str, RateLimiter] = {}
+        self._method_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+
+    def _limiters(self, routing: str, method: str) -> Tuple[RateLimiter, RateLimiter]:
+        app = self._app_limiters.get(routing)
+        if app is None:
+            app = self._app_limiters[routing] = RateLimiter(_DEFAULT_APP_LIMITS)
+        key = (routing, method)
+        method_limiter = self._method_limiters.get(key)
+        if method_limiter is None:
+            method_limiter = self._method_limiters[key] = RateLimiter(
+                _DEFAULT_METHOD_LIMITS
+            )
+        return app, method_limiter
+
+    def _acquire(self, routing: str, method: str) -> None:
+        waited = 0.0
+        while True:
+            with self._lock:
+                app, method_limiter = self._limiters(routing, method)
+                now = time.monotonic()
+                wait = max(app.wait_time(now), method_limiter.wait_time(now))
+                if wait <= 0:
+                    app.consume(now)
+                    method_limiter.consume(now)
+                    break
+            time.sleep(wait)
+            waited += wait
+        if waited and self.metrics is not None:
+            self.metrics.observe_wait(method, waited)
+
+    def _record_budget(self, routing: str, method: str, headers: Any) -> None:
+        # X-*-Rate-Limit "100:120" with X-*-Rate-Limit-Count "7:120" -> 93 left.
+        for scope, prefix, endpoint in (
+            ("application", "X-App-Rate-Limit", ""),
+            ("method", "X-Method-Rate-Limit", method),
+        ):
+            used = {
+                window: count
+                for count, window in _parse_limits(headers.get(f"{prefix}-Count"))
+            }
+            for limit, window in _parse_limits(headers.get(prefix)):
+                if window in used:
+                    self.metrics.observe_budget(
+                        scope, routing, endpoint, window, limit - used[window]
+                    )
+
+    def _record_limits(
+        self, routing: str, method: str, response: requests.Response
+    ) -> None:
+        headers = response.headers
+        with self._lock:
+            app, method_limiter = self._limiters(routing, method)
+            now = time.monotonic()
+            app.update(
+                headers.get("X-App-Rate-Limit"),
+                headers.get("X-App-Rate-Limit-Count"),
+                now,
+            )
+            method_limiter.update(
+                headers.get("X-Method-Rate-Limit"),
+                headers.get("X-Method-Rate-Limit-Count"),
+                now,
+            )
+            if response.status_code == 429:
+                retry_after = _retry_after(response)
+                limit_type = headers.get("X-Rate-Limit-Type")
+                if limit_type == "application":
+                    app.block(retry_after, now)
+                elif limit_type == "method":
+                    method_limiter.block(retry_after, now)
+
+    def get(
+        self,
+        routing: str,
+        path: str,
+        method: str,
+        params: Dict[str, Any] | None = None,
+    ) -> Any:
+        if self.base_url:
+            url = f"{self.base_url}{path}"
+        else:
+            url = f"https://{routing}.api.riotgames.com{path}"
+        for attempt in range(self.max_retries + 1):
+            self._acquire(routing, method)
+            started = time.perf_counter()
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            elapsed = time.perf_counter() - started
+            self._record_limits(routing, method, response)
+            if self.metrics is not None:
+                self.metrics.observe_request(
+                    method, response.status_code, elapsed, len(response.content)
+                )
+                self._record_budget(routing, method, response.headers)
+                if response.status_code == 429:
+                    self.metrics.observe_throttle(
+                        method, response.headers.get("X-Rate-Limit-Type", "")
+                    )
+            if response.status_code == 429 and attempt < self.max_retries:
+                # Application/method 429s block their limiter (_record_limits);
+                # any other 429 ("service" or untyped) only delays this request.
+                limit_type = response.headers.get("X-Rate-Limit-Type")
+                if limit_type not in ("application", "method"):
+                    time.sleep(_retry_after(response, min(2**attempt, 30)))
+                continue
+            if response.status_code >= 500 and attempt < self.max_retries:
+                time.sleep(min(2**attempt, 30))
+                continue
+            response.raise_for_status()
+            return self._decode(method, response)
+        response.raise_for_status()
+        return self._decode(method, response)
+
+    def _decode(self, method: str, response: requests.Response) -> Any:
+        if self.metrics is None:
+            return response.json()
+        started = time.perf_counter()
+        payload = response.json()
+        self.metrics.add_parse_time(method, time.perf_counter() - started)
+        return payload
+
+    def platform(
+        self, path: str, method: str, params: Dict[str, Any] | None = None
+    ) -> Any:
+        return self.get(self.platform_routing, path, method, params)
+
+    def regional(
+        self, path: str, method: str, params: Dict[str, Any] | None = None
+    ) -> Any:
+        return self.get(self.regional_routing, path, method, params)
+
+
+def _retry_after(response: requests.Response, default: float = 1.0) -> float:
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+def fetch_many(
+    client: RiotClient,
+    fetch: Callable[[RiotClient, str], Any],
+    keys: Iterable[str],
+    max_workers: int = 8,
+    max_in_flight: int | None = None,
+) -> Iterator[Tuple[str, Any]]:
+    # Results come back in input order; the shared limiters keep all workers inside
+    # the app/method budgets. At most `max_in_flight` (default 2x workers) fetches
+    # are submitted ahead of the consumer, so a slow consumer holds a bounded
+    # number of payloads instead of every result.
+    if max_workers <= 1:
+        for key in keys:
+            yield key, fetch(client, key)
+        return
+    in_flight = max(max_in_flight or 2 * max_workers, 1)
+    pending: Deque[Tuple[str, Future]] = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for key in keys:
+            pending.append((key, executor.submit(fetch, client, key)))
+            if len(pending) >= in_flight:
+                done_key, future = pending.popleft()
+                yield done_key, future.result()
+        while pending:
+            done_key, future = pending.popleft()
+            yield done_key, future.result()
+
+
+def get_account_by_riot_id(client: RiotClient, game_name: str, tag_line: str) -> Dict:
+    return client.regional(
+        f"/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}",
+        "account-v1.by-riot-id",
+    )
+
+
+def get_summoner_by_puuid(client: RiotClient, puuid: str) -> Dict:
+    return client.platform(
+        f"/lol/summoner/v4/summoners/by-puuid/{puuid}", "summoner-v4.by-puuid"
+    )
+
+
+def get_league_entries_by_summoner_id(client: RiotClient, summoner_id: str) -> List:
+    return client.platform(
+        f"/lol/league/v4/entries/by-summoner/{summoner_id}", "league-v4.by-summoner"
+    )
+
+
+def get_champion_mastery_by_puuid(client: RiotClient, puuid: str) -> List:
+    return client.platform(
+        f"/lol/champion-mastery/v4/champion-masteries/by-puuid/{puuid}",
+        "champion-mastery-v4.by-puuid",
+    )
+
+
+def get_match_ids_by_puuid(
+    client: RiotClient,
+    puuid: str,
+    count: int = 20,
+    start: int = 0,
+    queue: int | None = None,
+    start_time: int | None = None,
+) -> List[str]:
+    params: Dict[str, Any] = {"start": start, "count": count}
+    if queue is not None:
+        params["queue"] = queue
+    if start_time is not None:
+        # Epoch seconds; only matches started at or after it are listed.
+        params["startTime"] = start_time
+    return client.regional(
+        f"/lol/match/v5/matches/by-puuid/{puuid}/ids", "match-v5.ids-by-puuid", params
+    )
+
+
+def get_match(client: RiotClient, match_id: str) -> Dict:
+    return client.regional(f"/lol/match/v5/matches/{match_id}", "match-v5.match")
+
+
+def get_match_timeline(client: RiotClient, match_id: str) -> Dict:
+    return client.regional(
+        f"/lol/match/v5/matches/{match_id}/timeline", "match-v5.timeline"
+    )
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+from typing import Any, Dict, Iterable, List, Tuple
+
+from csv_exporter import write_csv
+from sqlite_store import SqliteStore
+from storage import read_json, write_json
+
+
+# table -> fact_match_player columns it is grouped by
+ROLLUPS: Dict[str, Tuple[str, ...]] = {
+    "agg_champion_patch": ("championId", "champion", "patch"),
+    "agg_champion_role": ("championId", "champion", "role"),
+    "agg_role_queue": ("role", "queue_id"),
+    "agg_player_champion": ("puuid", "championId", "champion"),
+}
+_MEASURES = (
+    "win",
+    "kills",
+    "deaths",
+    "assists",
+    "cs",
+    "cs_per_min",
+    "gold",
+    "damage",
+    "vision_score",
+    "game_duration",
+)
+
+
+# Group columns holding integers; rows read back from a CSV carry them as text.
+_INT_COLUMNS = {"championId", "queue_id"}
+
+
+def _group_value(column: str, value: Any) -> Any:
+    # Live rows and rows read back from a CSV ("" for null, digits for IDs) have
+    # to land in the same group.
+    if value is None or value == "":
+        return None
+    if column in _INT_COLUMNS and isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _group_key(columns: Tuple[str, ...], values: Iterable[Any]) -> str:
+    return json.dumps(
+        [_group_value(column, value) for column, value in zip(columns, values)]
+    )
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value) if value not in (None, "") else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _measures(row: Dict[str, Any]) -> List[float]:
+    values = {name: _number(row.get(name)) for name in _MEASURES}
+    minutes = values["game_duration"] / 60
+    values["cs_per_min"] = values["cs"] / minutes if minutes else 0.0
+    return [values[name] for name in _MEASURES]
+
+
+class RollupStore:
+    # Mergeable partials per group: [games, sum of each measure, sum of squares of
+    # each measure]. Batches of new fact_match_player rows are merged in, so
+    # averages, standard deviations and win rates never rescan the history. The
+    # caller feeds only rows its sink newly inserted, so the (match_id, puuid)
+    # dedupe of the fact table also keeps rows from being counted twice. `run` is
+    # the journal run the state was last saved in, written together with the
+    # partials, so a resumed run knows whether they already include its rows.
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # table -> JSON-encoded group values -> partials
+        self.state: Dict[str, Dict[str, List[float]]] = {}
+        self.run: str | None = None
+        self.reset()
+        # False on a first run and when the state file was lost; the caller then
+        # seeds the partials from the published fact_match_player rows.
+        self.loaded = os.path.exists(path)
+        if self.loaded:
+            saved = read_json(path)
+            self.run = saved.get("run")
+            # Re-keyed on load, so states saved before keys were normalised merge
+            # into the same groups.
+            for table, groups in saved.get("rollups", {}).items():
+                if table not in ROLLUPS:
+                    continue
+                for key, partials in groups.items():
+                    key = _group_key(ROLLUPS[table], json.loads(key))
+                    self._merge(table, key, partials)
+
+    def reset(self) -> None:
+        self.state = {table: {} for table in ROLLUPS}
+
+    def _merge(self, table: str, key: str, partials: List[float]) -> None:
+        current = self.state[table].get(key)
+        if current is None:
+            self.state[table][key] = list(partials)
+        else:
+            for index, value in enumerate(partials):
+                current[index] += value
+
+    def add(self, rows: Iterable[Dict[str, Any]]) -> int:
+        width = len(_MEASURES)
+        count = 0
+        for row in rows:
+            values = _measures(row)
+            for table, columns in ROLLUPS.items():
+                key = _group_key(columns, (row.get(column) for column in columns))
+                partials = self.state[table].get(key)
+                if partials is None:
+                    partials = self.state[table][key] = [0.0] * (1 + 2 * width)
+                partials[0] += 1
+                for index, value in enumerate(values):
+                    partials[1 + index] += value
+                    partials[1 + width + index] += value * value
+            count += 1
+        return count
+
+    def rows(self, table: str) -> List[Dict[str, Any]]:
+        columns = ROLLUPS[table]
+        width = len(_MEASURES)
+        rows: List[Dict[str, Any]] = []
+        for key, partials in sorted(self.state[table].items()):
+            games = partials[0]
+            row: Dict[str, Any] = dict(zip(columns, json.loads(key)))
+            row["games"] = int(games)
+            sums = dict(zip(_MEASURES, partials[1 : 1 + width]))
+            squares = dict(zip(_MEASURES, partials[1 + width :]))
+            row["wins"] = int(sums["win"])
+            row["win_rate"] = round(sums["win"] / games, 4)
+            row["kda"] = round(
+                (sums["kills"] + sums["assists"]) / max(sums["deaths"], 1), 3
+            )
+            for name in _MEASURES[1:]:
+                mean = sums[name] / games
+                variance = max(squares[name] / games - mean * mean, 0.0)
+                row[f"avg_{name}"] = round(mean, 3)
+                row[f"std_{name}"] = round(math.sqrt(variance), 3)
+            rows.append(row)
+        return rows
+
+    def save(self, run: str | None = None) -> None:
+        self.run = run
+        write_json(self.path, {"rollups": self.state, "run": run}, compact=True)
+
+    def export(
+        self, csv_dir: str, store: SqliteStore | None = None, run: str | None = None
+    ) -> None:
+        # Rollup tables are small, so they are rewritten whole from the partials.
+        for table in ROLLUPS:
+            rows = self.rows(table)
+            write_csv(os.path.join(csv_dir, f"{table}.csv"), rows)
+            if store is not None:
+                store.load(table, rows, replace=True)
+        self.save(run)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+import os
+import pickle
+import shutil
+import uuid
+from typing import IO, Any, Dict, Set
+
+from storage import atomic_write
+
+
+_JOURNAL_NAME = "journal.jsonl"
+_SPILL_DIR = "spill"
+
+
+class RunJournal:
+    # Progress of the ingestion run in `root`, so a crashed, banned or interrupted
+    # run resumes instead of starting over. journal.jsonl starts with the run's ID
+    # ({"run_id"}) and gains one line per finished match stage ({"stage",
+    # "match_id"}); outputs saved outside it (the rollup state) record the run ID
+    # instead. Stages are "fetched" (payloads received), "raw" (persisted in the raw
+    # archive and cache index) and "rows" (transformed rows spilled to
+    # spill/<match_id>.pkl); matches past "rows" are not fetched again. commit()
+    # deletes both once the outputs are published; a journal left behind means the
+    # last run did not finish.
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.path = os.path.join(root, _JOURNAL_NAME)
+        self.spill_dir = os.path.join(root, _SPILL_DIR)
+        self.matches: Dict[str, Set[str]] = {}
+        self.run_id: str | None = None
+        self._handle: IO[str] | None = None
+        if os.path.exists(self.path):
+            self._read()
+        elif os.path.isdir(self.spill_dir):
+            # Left over by a run that stopped between removing its journal and
+            # its spill files.
+            shutil.rmtree(self.spill_dir)
+        self.resumed = bool(self.matches)
+        # Written with the first stage line, so a journal without one is new.
+        self._run_id_written = self.run_id is not None
+        if self.run_id is None:
+            self.run_id = uuid.uuid4().hex
+
+    def _read(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line torn by the crash; its stage simply runs again.
+                    continue
+                if "run_id" in entry:
+                    self.run_id = entry["run_id"]
+                elif "match_id" in entry:
+                    stages = self.matches.setdefault(entry["match_id"], set())
+                    stages.add(entry["stage"])
+
+    def _append(self, entry: Dict[str, str]) -> None:
+        if self._handle is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._handle = open(self.path, "a", encoding="utf-8")
+        if not self._run_id_written:
+            self._handle.write(json.dumps({"run_id": self.run_id}) + "\n")
+            self._run_id_written = True
+        self._handle.write(json.dumps(entry) + "\n")
+        # Flushed per line: the journal has to survive the process, not the host.
+        self._handle.flush()
+
+    def done(self, match_id: str, stage: str = "rows") -> bool:
+        return stage in self.matches.get(match_id, ())
+
+    def mark(self, match_id: str, stage: str) -> None:
+        if self.done(match_id, stage):
+            return
+        self.matches.setdefault(match_id, set()).add(stage)
+        self._append({"match_id": match_id, "stage": stage})
+
+    def _spill_path(self, match_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{match_id}.pkl")
+
+    def spill(self, match_id: str, record: Any) -> None:
+        # The spill file is complete before "rows" is journaled, so a match marked
+        # done always has its rows on disk.
+        with atomic_write(self._spill_path(match_id), "wb") as handle:
+            pickle.dump(record, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        self.mark(match_id, "rows")
+
+    def load(self, match_id: str) -> Any:
+        with open(self._spill_path(match_id), "rb") as handle:
+            return pickle.load(handle)
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def commit(self) -> None:
+        # Removing the journal is the commit point; the spill files go after it.
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        if os.path.isdir(self.spill_dir):
+            shutil.rmtree(self.spill_dir)
+        self.matches = {}
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+
+from config import CSV_DIR, OUTPUT_MODE, PARTITION_DIR
+from csv_exporter import StreamingCsvWriter, UpsertCsvWriter, read_csv
+from partitions import PartitionWriter, read_partitions
+from sqlite_store import SqliteStore
+
+
+class TableSink:
+    # Streams one output table to its CSV (or date partitions) and, when enabled,
+    # the SQLite store, so per-match rows never accumulate in memory. With
+    # upsert_keys the CSV keeps its existing rows and only gains new keys.
+    def __init__(
+        self,
+        table: str,
+        key: str = "match_id",
+        store: SqliteStore | None = None,
+        partitioned: bool | None = None,
+        upsert_keys: Sequence[str] | None = None,
+        keep: Callable[[Dict[str, Any]], bool] | None = None,
+    ) -> None:
+        self.table = table
+        self.store = store
+        self.partitioned = (
+            OUTPUT_MODE == "partitioned" if partitioned is None else partitioned
+        )
+        path = os.path.join(CSV_DIR, f"{table}.csv")
+        self.writer: PartitionWriter | StreamingCsvWriter | UpsertCsvWriter
+        if self.partitioned:
+            self.writer = PartitionWriter(PARTITION_DIR, table, key=key)
+        elif upsert_keys is not None:
+            self.writer = UpsertCsvWriter(path, upsert_keys, keep=keep)
+        else:
+            self.writer = StreamingCsvWriter(path)
+
+    def write(
+        self, rows: List[Dict[str, Any]], datetime_utc: str
+    ) -> List[Dict[str, Any]]:
+        # Returns the rows new to the output: partitions and upserts skip keys they
+        # already hold, a plain CSV is rewritten in full.
+        if isinstance(self.writer, PartitionWriter):
+            written = self.writer.writerows(rows, datetime_utc)
+        elif isinstance(self.writer, UpsertCsvWriter):
+            written = self.writer.writerows(rows)
+        else:
+            self.writer.writerows(rows)
+            written = rows
+        if self.store is not None:
+            self.store.load(self.table, rows)
+        return written
+
+    def prepare(self) -> None:
+        # Writes out everything but the final renames, which happen on close.
+        self.writer.prepare()
+
+    def __enter__(self) -> "TableSink":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        self.writer.__exit__(exc_type, exc, traceback)
+
+
+def published_rows(table: str) -> Iterator[Dict[str, str]]:
+    # The rows earlier runs published for `table`, from wherever TableSink writes
+    # it in the current OUTPUT_MODE.
+    if OUTPUT_MODE == "partitioned":
+        return read_partitions(PARTITION_DIR, table)
+    return read_csv(os.path.join(CSV_DIR, f"{table}.csv"))
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+
+# table -> (primary key columns, secondary index columns)
+_TABLES: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "agg_champion_patch": (("championId", "champion", "patch"), ()),
+    "agg_champion_role": (("championId", "champion", "role"), ()),
+    "agg_heatmap_champion": (
+        ("championId", "game_phase", "event", "cell_x", "cell_y"),
+        (),
+    ),
+    "agg_heatmap_player": (("puuid", "game_phase", "event", "cell_x", "cell_y"), ()),
+    "agg_player_champion": (("puuid", "championId", "champion"), ()),
+    "agg_role_queue": (("role", "queue_id"), ()),
+    "dim_champion": (("championId", "version"), ()),
+    "dim_champion_latest": (("championId",), ()),
+    "dim_item": (("itemId", "version"), ()),
+    "dim_queue": (("queueId",), ()),
+    "dim_rune": (("runeId", "version"), ()),
+    "dim_summoner_spell": (("spellId", "version"), ()),
+    "fact_match_events": (
+        ("match_id", "event_index", "event"),
+        ("puuid", "championId", "event"),
+    ),
+    "fact_match_player": (
+        ("match_id", "puuid"),
+        ("puuid", "championId", "patch", "queue_id"),
+    ),
+    "fact_match_timeline_clean": (
+        ("match_id", "participant_id", "game_phase"),
+        ("puuid", "championId"),
+    ),
+    "fact_match_timeline_wards": (
+        ("match_id", "participant_id", "game_phase"),
+        ("puuid", "championId"),
+    ),
+    "fact_skill_level_up": (
+        ("match_id", "participant_id", "timestamp", "skill_slot"),
+        ("puuid", "championId"),
+    ),
+    "match_participant_perks": (
+        ("match_id", "participantId", "style_description", "slot"),
+        ("perk",),
+    ),
+    "match_participants": (
+        ("match_id", "participantId"),
+        ("puuid", "championId"),
+    ),
+    "match_team_bans": (("match_id", "teamId", "pickTurn"), ("championId",)),
+    "match_team_objectives": (("match_id", "teamId", "objective"), ()),
+    "match_teams": (("match_id", "teamId"), ()),
+    "match_timelines": (("match_id", "timestamp"), ()),
+    "matches": (("matchId",), ("info.queueId", "info.gameVersion")),
+}
+_CHUNK_SIZE = 1000
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _chunks(rows: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, _CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+class SqliteStore:
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._columns: Dict[str, set[str]] = {}
+        for table in _TABLES:
+            self._create_table(table)
+
+    def _create_table(self, table: str) -> None:
+        primary_key, indexes = _TABLES[table]
+        if table.startswith("dim_") and self._primary_key(table) not in (
+            (),
+            primary_key,
+        ):
+            # Dimensions are reloaded in full every run, so a table created with an
+            # older key (dim_champion before versioning) is simply rebuilt.
+            self.connection.execute(f"DROP TABLE {_quote(table)}")
+        columns = ", ".join(_quote(column) for column in primary_key)
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {_quote(table)} "
+            f"({columns}, PRIMARY KEY ({columns}))"
+        )
+        existing = {
+            row[1]
+            for row in self.connection.execute(f"PRAGMA table_info({_quote(table)})")
+        }
+        self._columns[table] = existing
+        for column in indexes:
+            self._ensure_column(table, column)
+            index_name = f"idx_{table}_{column}".replace(".", "_")
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {_quote(index_name)} "
+                f"ON {_quote(table)} ({_quote(column)})"
+            )
+
+    def _primary_key(self, table: str) -> Tuple[str, ...]:
+        rows = self.connection.execute(f"PRAGMA table_info({_quote(table)})")
+        key = sorted((row[5], row[1]) for row in rows if row[5])
+        return tuple(name for _, name in key)
+
+    def _ensure_column(self, table: str, column: str) -> None:
+        # Row shapes are open-ended (matches.csv carries every flattened key), so
+        # columns are added the first time a row mentions them.
+        if column in self._columns[table]:
+            return
+        self.connection.execute(
+            f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(column)}"
+        )
+        self._columns[table].add(column)
+
+    def load(
+        self, table: str, rows: Iterable[Dict[str, Any]], replace: bool = False
+    ) -> int:
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        before = self.connection.total_changes
+        with self.connection:
+            for chunk in _chunks(rows):
+                columns = sorted({key for row in chunk for key in row.keys()})
+                for column in columns:
+                    self._ensure_column(table, column)
+                placeholders = ", ".join("?" for _ in columns)
+                names = ", ".join(_quote(column) for column in columns)
+                self.connection.executemany(
+                    f"{verb} INTO {_quote(table)} ({names}) VALUES ({placeholders})",
+                    ([row.get(column) for column in columns] for row in chunk),
+                )
+        return self.connection.total_changes - before
+
+    def close(self) -> None:
+        self.connection.close()
@@ -1,15 +1,42 @@
 import json
 import os
-from typing import Any
+import uuid
+from contextlib import contextmanager
+from typing import Any, IO, Iterator
 
 
 def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def write_json(path: str, data: Any) -> None:
+@contextmanager
+def atomic_write(path: str, mode: str = "w", **kwargs: Any) -> Iterator[IO]:
+    # Writes land in a hidden temp file next to `path` and replace it only once
+    # complete, so a crash never leaves a truncated file behind.
     directory = os.path.dirname(path)
     if directory:
         ensure_dir(directory)
-    with open(path, "w", encoding="utf-8") as handle:
-        json.dump(data, handle, ensure_ascii=True, indent=2)
+    temp_path = os.path.join(
+        directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp"
+    )
+    try:
+        with open(temp_path, mode, **kwargs) as handle:
+            yield handle
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_json(path: str, data: Any, compact: bool = False) -> None:
+    with atomic_write(path, "w", encoding="utf-8") as handle:
+        if compact:
+            json.dump(data, handle, ensure_ascii=False, separators=(",", ":"))
+        else:
+            json.dump(data, handle, ensure_ascii=True, indent=2)
+
+
+def read_json(path: str) -> Any:
+    with open(path, "r", encoding="utf-8") as handle:
+        return json.load(handle)
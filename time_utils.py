@@ -1,31 +1,129 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from typing import Any, Dict
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple
 from zoneinfo import ZoneInfo
 
 
 _OUTPUT_FORMAT = "%Y-%m-%d %H:%M:%S"
+_SAO_PAULO = ZoneInfo("America/Sao_Paulo")
+# The precomputed offset table covers this UTC range (seconds); anything outside
+# goes through format_unix_ms.
+_TABLE_START = 0
+_TABLE_END = int(datetime(2100, 1, 1, tzinfo=timezone.utc).timestamp())
+_SCAN_STEP = 86400
 
 
-def format_unix_ms(timestamp_ms: Any) -> Dict[str, str]:
+def _to_ms(timestamp_ms: Any) -> int | None:
     if timestamp_ms in (None, ""):
-        return {"datetime_utc": "", "datetime_brasil": ""}
+        return None
     try:
         value = int(timestamp_ms)
     except (TypeError, ValueError):
-        return {"datetime_utc": "", "datetime_brasil": ""}
+        return None
     if value <= 0:
+        return None
+    return value
+
+
+def format_unix_ms(timestamp_ms: Any) -> Dict[str, str]:
+    value = _to_ms(timestamp_ms)
+    if value is None:
         return {"datetime_utc": "", "datetime_brasil": ""}
     dt_utc = datetime.fromtimestamp(value / 1000, tz=timezone.utc)
-    dt_br = dt_utc.astimezone(ZoneInfo("America/Sao_Paulo"))
+    dt_br = dt_utc.astimezone(_SAO_PAULO)
     return {
         "datetime_utc": dt_utc.strftime(_OUTPUT_FORMAT),
         "datetime_brasil": dt_br.strftime(_OUTPUT_FORMAT),
     }
 
 
+def _utc_offset(second: int) -> int:
+    moment = datetime.fromtimestamp(second, tz=timezone.utc).astimezone(_SAO_PAULO)
+    offset = moment.utcoffset() or timedelta(0)
+    return int(offset.total_seconds())
+
+
+@lru_cache(maxsize=1)
+def _offset_table() -> Tuple[List[int], List[int]]:
+    # Sao Paulo's UTC offset changes (Brazil's historical DST rules, abolished in
+    # 2019) found by scanning daily and bisecting each change down to the second.
+    starts = [_TABLE_START]
+    offsets = [_utc_offset(_TABLE_START)]
+    previous = _TABLE_START
+    for second in range(_TABLE_START + _SCAN_STEP, _TABLE_END, _SCAN_STEP):
+        offset = _utc_offset(second)
+        if offset == offsets[-1]:
+            previous = second
+            continue
+        low, high = previous, second
+        while high - low > 1:
+            middle = (low + high) // 2
+            if _utc_offset(middle) == offsets[-1]:
+                low = middle
+            else:
+                high = middle
+        starts.append(high)
+        offsets.append(offset)
+        previous = second
+    return starts, offsets
+
+
+@lru_cache(maxsize=4096)
+def _format_day(day: int) -> str:
+    return time.strftime("%Y-%m-%d ", time.gmtime(day * 86400))
+
+
+def _format_utc_second(second: int) -> str:
+    day, seconds = divmod(second, 86400)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%s%02d:%02d:%02d" % (_format_day(day), hours, minutes, seconds)
+
+
+@lru_cache(maxsize=65536)
+def _format_second(second: int) -> Tuple[str, str]:
+    starts, offsets = _offset_table()
+    offset = offsets[bisect_right(starts, second) - 1]
+    return _format_utc_second(second), _format_utc_second(second + offset)
+
+
+def format_unix_ms_batch(timestamps_ms: Iterable[Any]) -> List[Dict[str, str]]:
+    # Same output as format_unix_ms for every value, using the cached offset table
+    # and per-second memoization instead of zoneinfo lookups and strftime.
+    results: List[Dict[str, str]] = []
+    for timestamp_ms in timestamps_ms:
+        if type(timestamp_ms) is int and timestamp_ms > 0:
+            value: int | None = timestamp_ms
+        else:
+            value = _to_ms(timestamp_ms)
+        if value is None:
+            results.append({"datetime_utc": "", "datetime_brasil": ""})
+            continue
+        second = value // 1000
+        if not _TABLE_START <= second < _TABLE_END:
+            results.append(format_unix_ms(value))
+            continue
+        utc, brasil = _format_second(second)
+        results.append({"datetime_utc": utc, "datetime_brasil": brasil})
+    return results
+
+
 def add_datetime_fields(row: Dict[str, Any], base_key: str, timestamp_ms: Any) -> None:
     formatted = format_unix_ms(timestamp_ms)
     row[f"{base_key}_datetime_utc"] = formatted["datetime_utc"]
     row[f"{base_key}_datetime_brasil"] = formatted["datetime_brasil"]
+
+
+def add_datetime_fields_batch(
+    rows: List[Dict[str, Any]], base_key: str, source_key: str | None = None
+) -> None:
+    # add_datetime_fields(row, base_key, row[source_key]) for every row in one call.
+    source_key = source_key or base_key
+    formatted_rows = format_unix_ms_batch(row.get(source_key) for row in rows)
+    for row, formatted in zip(rows, formatted_rows):
+        row[f"{base_key}_datetime_utc"] = formatted["datetime_utc"]
+        row[f"{base_key}_datetime_brasil"] = formatted["datetime_brasil"]
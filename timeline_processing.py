@@ -1,8 +1,23 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Iterable, List
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
 
-from time_utils import format_unix_ms
+from time_utils import format_unix_ms_batch
+
+
+_PHASES = ("early", "mid", "late")
+# Summoner's Rift positions span about 0..15000 on both axes; heatmaps bin them
+# into a GRID_BINS x GRID_BINS grid (~234 units per cell).
+MAP_SIZE = 15000
+GRID_BINS = 64
+
+
+def grid_cell(x: int, y: int) -> Tuple[int, int]:
+    scale = GRID_BINS / MAP_SIZE
+    return (
+        min(max(int(x * scale), 0), GRID_BINS - 1),
+        min(max(int(y * scale), 0), GRID_BINS - 1),
+    )
 
 
 def _get_game_phase(minute_game: int) -> str:
@@ -14,74 +29,160 @@ def _get_game_phase(minute_game: int) -> str:
     return "late"
 
 
-def build_timeline_frame_rows(
-    match_id: str, frames: Iterable[Dict[str, Any]], match_start_ts: int | None
-) -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
+def _participant_info(participants: Iterable[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    participant_info: Dict[int, Dict[str, Any]] = {}
+    for participant in participants:
+        participant_id = participant.get("participantId")
+        if participant_id is None:
+            continue
+        participant_info[int(participant_id)] = {
+            "puuid": participant.get("puuid"),
+            "summoner_name": participant.get("summonerName"),
+            "championId": participant.get("championId"),
+            "team_id": participant.get("teamId"),
+        }
+    return participant_info
+
+
+class TimelineAggregator:
+    # Subclasses set `table`, fill `handlers` (event type -> callback) and override
+    # on_frame when they need frame-level data. The engine calls them in one pass.
+    table = ""
+
+    def __init__(self) -> None:
+        self.handlers: Dict[str, Callable[[Dict[str, Any], int, str], None]] = {}
+
+    def on_frame(
+        self,
+        frame: Dict[str, Any],
+        timestamp_ms: Any,
+        minute_game: int,
+        phase: str,
+    ) -> None:
+        pass
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return []
+
+
+def process_timeline(
+    frames: Iterable[Dict[str, Any]], aggregators: Sequence[TimelineAggregator]
+) -> Dict[str, List[Dict[str, Any]]]:
+    frame_aggregators = [
+        aggregator
+        for aggregator in aggregators
+        if type(aggregator).on_frame is not TimelineAggregator.on_frame
+    ]
+    dispatch: Dict[str, List[Callable[[Dict[str, Any], int, str], None]]] = {}
+    for aggregator in aggregators:
+        for event_type, handler in aggregator.handlers.items():
+            dispatch.setdefault(event_type, []).append(handler)
+
     for frame in frames:
         timestamp_ms = frame.get("timestamp")
-        if timestamp_ms is None:
-            continue
-        minute_game = int(timestamp_ms // 60000)
+        minute_game = int(timestamp_ms // 60000) if timestamp_ms else 0
         phase = _get_game_phase(minute_game)
+        for aggregator in frame_aggregators:
+            aggregator.on_frame(frame, timestamp_ms, minute_game, phase)
+
+        if not dispatch:
+            continue
+        # Ignore timestamp == 0 events to avoid synthetic start markers.
+        for event in frame.get("events", []):
+            handlers = dispatch.get(event.get("type"))
+            if handlers is None:
+                continue
+            event_ts = event.get("timestamp", 0)
+            if not event_ts:
+                continue
+            event_phase = _get_game_phase(int(event_ts // 60000))
+            for handler in handlers:
+                handler(event, event_ts, event_phase)
+
+    return {aggregator.table: aggregator.rows() for aggregator in aggregators}
+
+
+class FrameRowsAggregator(TimelineAggregator):
+    table = "match_timelines"
+
+    def __init__(self, match_id: str, match_start_ts: int | None) -> None:
+        super().__init__()
+        self.match_id = match_id
+        self.match_start_ts = match_start_ts
+        self._rows: List[Dict[str, Any]] = []
+        self._real_ts: List[int | None] = []
+
+    def on_frame(
+        self,
+        frame: Dict[str, Any],
+        timestamp_ms: Any,
+        minute_game: int,
+        phase: str,
+    ) -> None:
+        if timestamp_ms is None:
+            return
         real_ts = (
-            match_start_ts + timestamp_ms if match_start_ts is not None else None
+            self.match_start_ts + timestamp_ms
+            if self.match_start_ts is not None
+            else None
         )
-        real_formatted = format_unix_ms(real_ts) if real_ts else {"datetime_utc": "", "datetime_brasil": ""}
-        rows.append(
+        self._rows.append(
             {
-                "match_id": match_id,
+                "match_id": self.match_id,
                 "timestamp": timestamp_ms,
                 "minute_game": minute_game,
                 "game_phase": phase,
                 "realTimestamp": real_ts or "",
-                "realTimestamp_datetime_utc": real_formatted["datetime_utc"],
-                "realTimestamp_datetime_brasil": real_formatted["datetime_brasil"],
             }
         )
-    return rows
+        self._real_ts.append(real_ts)
 
+    def rows(self) -> List[Dict[str, Any]]:
+        # Real timestamps are formatted in one batch once all frames are seen.
+        for row, formatted in zip(self._rows, format_unix_ms_batch(self._real_ts)):
+            row["realTimestamp_datetime_utc"] = formatted["datetime_utc"]
+            row["realTimestamp_datetime_brasil"] = formatted["datetime_brasil"]
+        return self._rows
 
-def build_fact_match_timeline_rows(
-    match_id: str,
-    frames: Iterable[Dict[str, Any]],
-    participants: Iterable[Dict[str, Any]],
-) -> List[Dict[str, Any]]:
-    participant_info: Dict[int, Dict[str, Any]] = {}
-    for participant in participants:
-        participant_id = participant.get("participantId")
-        if participant_id is None:
-            continue
-        participant_info[int(participant_id)] = {
-            "puuid": participant.get("puuid"),
-            "summoner_name": participant.get("summonerName"),
-            "championId": participant.get("championId"),
-            "team_id": participant.get("teamId"),
-        }
 
-    phases = ("early", "mid", "late")
-    stats: Dict[int, Dict[str, Dict[str, int]]] = {}
-    for participant_id in participant_info:
-        stats[participant_id] = {
-            phase: {
-                "kills": 0,
-                "deaths": 0,
-                "item_purchases": 0,
-                "objectives": 0,
-                "gold_total": 0,
-                "xp_total": 0,
-                "level_max": 0,
-                "cs_total": 0,
+class PhaseStatsAggregator(TimelineAggregator):
+    table = "fact_match_timeline_clean"
+
+    def __init__(self, match_id: str, participants: Iterable[Dict[str, Any]]) -> None:
+        super().__init__()
+        self.match_id = match_id
+        self.participant_info = _participant_info(participants)
+        self.stats: Dict[int, Dict[str, Dict[str, int]]] = {}
+        for participant_id in self.participant_info:
+            self.stats[participant_id] = {
+                phase: {
+                    "kills": 0,
+                    "deaths": 0,
+                    "item_purchases": 0,
+                    "objectives": 0,
+                    "gold_total": 0,
+                    "xp_total": 0,
+                    "level_max": 0,
+                    "cs_total": 0,
+                }
+                for phase in _PHASES
             }
-            for phase in phases
+        self.handlers = {
+            "CHAMPION_KILL": self._champion_kill,
+            "ITEM_PURCHASED": self._item_purchased,
+            "ELITE_MONSTER_KILL": self._elite_monster_kill,
+            "BUILDING_KILL": self._building_kill,
         }
 
-    for frame in frames:
-        timestamp_ms = frame.get("timestamp", 0)
-        minute_game = int(timestamp_ms // 60000) if timestamp_ms else 0
-        phase = _get_game_phase(minute_game)
-
+    def on_frame(
+        self,
+        frame: Dict[str, Any],
+        timestamp_ms: Any,
+        minute_game: int,
+        phase: str,
+    ) -> None:
         # Use the latest frame in each phase to represent gold/xp/cs totals.
+        stats = self.stats
         participant_frames = frame.get("participantFrames", {})
         for participant_id_str, payload in participant_frames.items():
             try:
@@ -105,63 +206,311 @@ def build_fact_match_timeline_rows(
             )
             phase_stats["cs_total"] = cs_total
 
-        # Ignore timestamp == 0 events to avoid synthetic start markers.
-        for event in frame.get("events", []):
-            event_ts = event.get("timestamp", 0)
-            if not event_ts:
+    def _champion_kill(self, event: Dict[str, Any], event_ts: int, phase: str) -> None:
+        killer_id = event.get("killerId")
+        victim_id = event.get("victimId")
+        if killer_id in self.stats:
+            self.stats[killer_id][phase]["kills"] += 1
+        if victim_id in self.stats:
+            self.stats[victim_id][phase]["deaths"] += 1
+
+    def _item_purchased(self, event: Dict[str, Any], event_ts: int, phase: str) -> None:
+        participant_id = event.get("participantId")
+        if participant_id in self.stats:
+            self.stats[participant_id][phase]["item_purchases"] += 1
+
+    def _elite_monster_kill(
+        self, event: Dict[str, Any], event_ts: int, phase: str
+    ) -> None:
+        if event.get("monsterType") in {"DRAGON", "BARON_NASHOR"}:
+            killer_id = event.get("killerId")
+            if killer_id in self.stats:
+                self.stats[killer_id][phase]["objectives"] += 1
+
+    def _building_kill(self, event: Dict[str, Any], event_ts: int, phase: str) -> None:
+        if event.get("buildingType") == "TOWER_BUILDING":
+            killer_id = event.get("killerId")
+            if killer_id in self.stats:
+                self.stats[killer_id][phase]["objectives"] += 1
+
+    def rows(self) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        for participant_id, phase_stats in self.stats.items():
+            base = self.participant_info.get(participant_id, {})
+            for phase in _PHASES:
+                payload = phase_stats[phase]
+                rows.append(
+                    {
+                        "match_id": self.match_id,
+                        "participant_id": participant_id,
+                        "puuid": base.get("puuid"),
+                        "summoner_name": base.get("summoner_name"),
+                        "championId": base.get("championId"),
+                        "team_id": base.get("team_id"),
+                        "game_phase": phase,
+                        "kills": payload["kills"],
+                        "deaths": payload["deaths"],
+                        "item_purchases": payload["item_purchases"],
+                        "objectives": payload["objectives"],
+                        "gold_total": payload["gold_total"],
+                        "xp_total": payload["xp_total"],
+                        "level_max": payload["level_max"],
+                        "cs_total": payload["cs_total"],
+                    }
+                )
+        return rows
+
+
+class WardAggregator(TimelineAggregator):
+    table = "fact_match_timeline_wards"
+
+    def __init__(self, match_id: str, participants: Iterable[Dict[str, Any]]) -> None:
+        super().__init__()
+        self.match_id = match_id
+        self.participant_info = _participant_info(participants)
+        self.counts: Dict[int, Dict[str, Dict[str, int]]] = {
+            participant_id: {
+                phase: {"wards_placed": 0, "wards_killed": 0} for phase in _PHASES
+            }
+            for participant_id in self.participant_info
+        }
+        self.handlers = {
+            "WARD_PLACED": self._ward_placed,
+            "WARD_KILL": self._ward_kill,
+        }
+
+    def _ward_placed(self, event: Dict[str, Any], event_ts: int, phase: str) -> None:
+        creator_id = event.get("creatorId")
+        if creator_id in self.counts:
+            self.counts[creator_id][phase]["wards_placed"] += 1
+
+    def _ward_kill(self, event: Dict[str, Any], event_ts: int, phase: str) -> None:
+        killer_id = event.get("killerId")
+        if killer_id in self.counts:
+            self.counts[killer_id][phase]["wards_killed"] += 1
+
+    def rows(self) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        for participant_id, phase_counts in self.counts.items():
+            base = self.participant_info[participant_id]
+            for phase in _PHASES:
+                rows.append(
+                    {
+                        "match_id": self.match_id,
+                        "participant_id": participant_id,
+                        "puuid": base.get("puuid"),
+                        "championId": base.get("championId"),
+                        "team_id": base.get("team_id"),
+                        "game_phase": phase,
+                        "wards_placed": phase_counts[phase]["wards_placed"],
+                        "wards_killed": phase_counts[phase]["wards_killed"],
+                    }
+                )
+        return rows
+
+
+class SkillLevelUpAggregator(TimelineAggregator):
+    table = "fact_skill_level_up"
+
+    def __init__(self, match_id: str, participants: Iterable[Dict[str, Any]]) -> None:
+        super().__init__()
+        self.match_id = match_id
+        self.participant_info = _participant_info(participants)
+        self._rows: List[Dict[str, Any]] = []
+        self.handlers = {"SKILL_LEVEL_UP": self._skill_level_up}
+
+    def _skill_level_up(self, event: Dict[str, Any], event_ts: int, phase: str) -> None:
+        participant_id = event.get("participantId")
+        base = self.participant_info.get(participant_id, {})
+        self._rows.append(
+            {
+                "match_id": self.match_id,
+                "participant_id": participant_id,
+                "puuid": base.get("puuid"),
+                "championId": base.get("championId"),
+                "timestamp": event_ts,
+                "minute_game": int(event_ts // 60000),
+                "game_phase": phase,
+                "skill_slot": event.get("skillSlot"),
+                "level_up_type": event.get("levelUpType"),
+            }
+        )
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return self._rows
+
+
+class SpatialEventAggregator(TimelineAggregator):
+    # One row per participant in a positioned event: killer and victim of a
+    # CHAMPION_KILL ("kill"/"death"), the killer of an ELITE_MONSTER_KILL or
+    # BUILDING_KILL, the creator of a WARD_PLACED and the killer of a WARD_KILL.
+    # Ward events carry no position, so they take the participant's position in
+    # the frame closing their minute (position_source "frame").
+    table = "fact_match_events"
+
+    def __init__(self, match_id: str, participants: Iterable[Dict[str, Any]]) -> None:
+        super().__init__()
+        self.match_id = match_id
+        self.participant_info = _participant_info(participants)
+        self._positions: Dict[int, Tuple[int, int]] = {}
+        self._event_index = 0
+        self._rows: List[Dict[str, Any]] = []
+        self.handlers = {
+            "CHAMPION_KILL": self._champion_kill,
+            "ELITE_MONSTER_KILL": self._elite_monster_kill,
+            "BUILDING_KILL": self._building_kill,
+            "WARD_PLACED": self._ward_placed,
+            "WARD_KILL": self._ward_kill,
+        }
+
+    def on_frame(
+        self,
+        frame: Dict[str, Any],
+        timestamp_ms: Any,
+        minute_game: int,
+        phase: str,
+    ) -> None:
+        # Runs before the frame's events are dispatched.
+        for participant_id_str, payload in frame.get("participantFrames", {}).items():
+            position = payload.get("position")
+            if not position:
                 continue
-            event_phase = _get_game_phase(int(event_ts // 60000))
-            event_type = event.get("type")
-            if event_type == "CHAMPION_KILL":
-                killer_id = event.get("killerId")
-                victim_id = event.get("victimId")
-                if killer_id in stats:
-                    stats[killer_id][event_phase]["kills"] += 1
-                if victim_id in stats:
-                    stats[victim_id][event_phase]["deaths"] += 1
+            try:
+                participant_id = int(participant_id_str)
+            except (TypeError, ValueError):
                 continue
-            if event_type == "ITEM_PURCHASED":
-                participant_id = event.get("participantId")
-                if participant_id in stats:
-                    stats[participant_id][event_phase]["item_purchases"] += 1
+            self._positions[participant_id] = (
+                position.get("x") or 0,
+                position.get("y") or 0,
+            )
+
+    def _emit(
+        self,
+        event: Dict[str, Any],
+        event_ts: int,
+        phase: str,
+        actors: Sequence[Tuple[str, Any]],
+        detail: Any,
+    ) -> None:
+        self._event_index += 1
+        position = event.get("position")
+        for kind, participant_id in actors:
+            base = self.participant_info.get(participant_id)
+            if base is None:
                 continue
-            if event_type == "ELITE_MONSTER_KILL":
-                monster_type = event.get("monsterType")
-                if monster_type in {"DRAGON", "BARON_NASHOR"}:
-                    killer_id = event.get("killerId")
-                    if killer_id in stats:
-                        stats[killer_id][event_phase]["objectives"] += 1
+            if position:
+                x, y = position.get("x") or 0, position.get("y") or 0
+                source = "event"
+            elif participant_id in self._positions:
+                x, y = self._positions[participant_id]
+                source = "frame"
+            else:
                 continue
-            if event_type == "BUILDING_KILL":
-                building_type = event.get("buildingType")
-                if building_type == "TOWER_BUILDING":
-                    killer_id = event.get("killerId")
-                    if killer_id in stats:
-                        stats[killer_id][event_phase]["objectives"] += 1
-
-    rows: List[Dict[str, Any]] = []
-    for participant_id, phase_stats in stats.items():
-        base = participant_info.get(participant_id, {})
-        for phase in phases:
-            payload = phase_stats[phase]
-            rows.append(
+            cell_x, cell_y = grid_cell(x, y)
+            self._rows.append(
                 {
-                    "match_id": match_id,
+                    "match_id": self.match_id,
+                    "event_index": self._event_index,
+                    "event_type": event.get("type"),
+                    "event": kind,
+                    "detail": detail,
+                    "timestamp": event_ts,
+                    "minute_game": int(event_ts // 60000),
+                    "game_phase": phase,
                     "participant_id": participant_id,
                     "puuid": base.get("puuid"),
-                    "summoner_name": base.get("summoner_name"),
                     "championId": base.get("championId"),
                     "team_id": base.get("team_id"),
-                    "game_phase": phase,
-                    "kills": payload["kills"],
-                    "deaths": payload["deaths"],
-                    "item_purchases": payload["item_purchases"],
-                    "objectives": payload["objectives"],
-                    "gold_total": payload["gold_total"],
-                    "xp_total": payload["xp_total"],
-                    "level_max": payload["level_max"],
-                    "cs_total": payload["cs_total"],
+                    "x": x,
+                    "y": y,
+                    "position_source": source,
+                    "cell_x": cell_x,
+                    "cell_y": cell_y,
                 }
             )
 
-    return rows
+    def _champion_kill(self, event: Dict[str, Any], event_ts: int, phase: str) -> None:
+        self._emit(
+            event,
+            event_ts,
+            phase,
+            (("kill", event.get("killerId")), ("death", event.get("victimId"))),
+            None,
+        )
+
+    def _elite_monster_kill(
+        self, event: Dict[str, Any], event_ts: int, phase: str
+    ) -> None:
+        self._emit(
+            event,
+            event_ts,
+            phase,
+            (("elite_monster", event.get("killerId")),),
+            event.get("monsterType"),
+        )
+
+    def _building_kill(self, event: Dict[str, Any], event_ts: int, phase: str) -> None:
+        self._emit(
+            event,
+            event_ts,
+            phase,
+            (("building", event.get("killerId")),),
+            event.get("buildingType"),
+        )
+
+    def _ward_placed(self, event: Dict[str, Any], event_ts: int, phase: str) -> None:
+        self._emit(
+            event,
+            event_ts,
+            phase,
+            (("ward_placed", event.get("creatorId")),),
+            event.get("wardType"),
+        )
+
+    def _ward_kill(self, event: Dict[str, Any], event_ts: int, phase: str) -> None:
+        self._emit(
+            event,
+            event_ts,
+            phase,
+            (("ward_kill", event.get("killerId")),),
+            event.get("wardType"),
+        )
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return self._rows
+
+
+def build_timeline_tables(
+    match_id: str,
+    frames: Iterable[Dict[str, Any]],
+    participants: Sequence[Dict[str, Any]],
+    match_start_ts: int | None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    return process_timeline(
+        frames,
+        [
+            FrameRowsAggregator(match_id, match_start_ts),
+            PhaseStatsAggregator(match_id, participants),
+            WardAggregator(match_id, participants),
+            SkillLevelUpAggregator(match_id, participants),
+            SpatialEventAggregator(match_id, participants),
+        ],
+    )
+
+
+def build_timeline_frame_rows(
+    match_id: str, frames: Iterable[Dict[str, Any]], match_start_ts: int | None
+) -> List[Dict[str, Any]]:
+    return process_timeline(frames, [FrameRowsAggregator(match_id, match_start_ts)])[
+        FrameRowsAggregator.table
+    ]
+
+
+def build_fact_match_timeline_rows(
+    match_id: str,
+    frames: Iterable[Dict[str, Any]],
+    participants: Iterable[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    return process_timeline(frames, [PhaseStatsAggregator(match_id, participants)])[
+        PhaseStatsAggregator.table
+    ]
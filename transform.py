@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+from csv_exporter import CompiledFlattener
+from time_utils import add_datetime_fields, format_unix_ms
+from timeline_processing import build_timeline_tables
+
+
+# Lists exploded out of the match payload, keyed on match_id like the fact tables.
+MATCH_CHILD_TABLES = (
+    "match_participants",
+    "match_participant_perks",
+    "match_teams",
+    "match_team_bans",
+    "match_team_objectives",
+)
+TIMELINE_TABLES = (
+    "match_timelines",
+    "fact_match_timeline_clean",
+    "fact_match_timeline_wards",
+    "fact_skill_level_up",
+    "fact_match_events",
+)
+
+
+# Compiled per process from the first payload; participants, teams, bans and
+# objectives go to MATCH_CHILD_TABLES instead of JSON strings in matches.csv.
+_match_flattener = CompiledFlattener(
+    skip=("metadata.participants", "info.participants", "info.teams")
+)
+_participant_flattener = CompiledFlattener(skip=("perks.styles",))
+_team_flattener = CompiledFlattener(skip=("bans", "objectives"))
+
+
+def build_match_row(match_id: str, match: Dict[str, Any]) -> Dict[str, Any]:
+    info = match.get("info", {})
+    match_row = _match_flattener(match)
+    match_row["matchId"] = match_id
+    add_datetime_fields(match_row, "info.gameCreation", info.get("gameCreation"))
+    add_datetime_fields(
+        match_row, "info.gameStartTimestamp", info.get("gameStartTimestamp")
+    )
+    return match_row
+
+
+def build_match_child_rows(
+    match_id: str, info: Dict[str, Any]
+) -> Dict[str, List[Dict[str, Any]]]:
+    tables: Dict[str, List[Dict[str, Any]]] = {
+        table: [] for table in MATCH_CHILD_TABLES
+    }
+    for participant in info.get("participants", []):
+        row = _participant_flattener(participant)
+        row["match_id"] = match_id
+        tables["match_participants"].append(row)
+        participant_id = participant.get("participantId")
+        for style in participant.get("perks", {}).get("styles", []):
+            for slot, selection in enumerate(style.get("selections", [])):
+                tables["match_participant_perks"].append(
+                    {
+                        "match_id": match_id,
+                        "participantId": participant_id,
+                        "style_description": style.get("description"),
+                        "style": style.get("style"),
+                        "slot": slot,
+                        "perk": selection.get("perk"),
+                        "var1": selection.get("var1"),
+                        "var2": selection.get("var2"),
+                        "var3": selection.get("var3"),
+                    }
+                )
+    for team in info.get("teams", []):
+        row = _team_flattener(team)
+        row["match_id"] = match_id
+        tables["match_teams"].append(row)
+        team_id = team.get("teamId")
+        for ban in team.get("bans", []):
+            tables["match_team_bans"].append(
+                {
+                    "match_id": match_id,
+                    "teamId": team_id,
+                    "pickTurn": ban.get("pickTurn"),
+                    "championId": ban.get("championId"),
+                }
+            )
+        for objective, values in team.get("objectives", {}).items():
+            tables["match_team_objectives"].append(
+                {
+                    "match_id": match_id,
+                    "teamId": team_id,
+                    "objective": objective,
+                    "first": values.get("first"),
+                    "kills": values.get("kills"),
+                }
+            )
+    return tables
+
+
+def build_fact_match_player_rows(
+    match_id: str,
+    info: Dict[str, Any],
+    game_time: Dict[str, str],
+    ddragon_version: str = "",
+) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    game_version = info.get("gameVersion", "")
+    for participant in info.get("participants", []):
+        cs_total = participant.get("totalMinionsKilled", 0) + participant.get(
+            "neutralMinionsKilled", 0
+        )
+        rows.append(
+            {
+                "match_id": match_id,
+                "puuid": participant.get("puuid"),
+                "summoner_name": participant.get("summonerName"),
+                "game_datetime": game_time["datetime_utc"],
+                "game_datetime_utc": game_time["datetime_utc"],
+                "game_datetime_brasil": game_time["datetime_brasil"],
+                "patch": game_version[:5] if game_version else "",
+                "ddragon_version": ddragon_version,
+                "queue_id": info.get("queueId"),
+                "game_duration": info.get("gameDuration"),
+                "win": 1 if participant.get("win") else 0,
+                "championId": participant.get("championId"),
+                "champion": participant.get("championName"),
+                "lane": participant.get("lane"),
+                "role": participant.get("teamPosition"),
+                "kills": participant.get("kills"),
+                "deaths": participant.get("deaths"),
+                "assists": participant.get("assists"),
+                "cs": cs_total,
+                "gold": participant.get("goldEarned"),
+                "vision_score": participant.get("visionScore"),
+                "damage": participant.get("totalDamageDealtToChampions"),
+            }
+        )
+    return rows
+
+
+def transform_match(
+    match_id: str,
+    match: Dict[str, Any],
+    timeline: Dict[str, Any],
+    ddragon_version: str = "",
+) -> Tuple[str, Dict[str, List[Dict[str, Any]]]]:
+    # Pure function of the raw payloads: returns the match date (UTC) and the rows
+    # of every table derived from one match, so the live run and the offline
+    # replay share the exact same output. ddragon_version is the Data Dragon
+    # release the static dimensions are joined on for this match.
+    info = match.get("info", {})
+    match_start_ts = info.get("gameStartTimestamp")
+    game_time = format_unix_ms(match_start_ts)
+
+    tables: Dict[str, List[Dict[str, Any]]] = {
+        "matches": [build_match_row(match_id, match)]
+    }
+    tables.update(build_match_child_rows(match_id, info))
+    # One pass over the frames feeds every timeline-derived table.
+    frames = timeline.get("info", {}).get("frames", [])
+    tables.update(
+        build_timeline_tables(
+            match_id, frames, info.get("participants", []), match_start_ts
+        )
+    )
+    tables["fact_match_player"] = build_fact_match_player_rows(
+        match_id, info, game_time, ddragon_version
+    )
+    return game_time["datetime_utc"], tables
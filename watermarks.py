@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List
+
+from storage import read_json, write_json
+
+
+class WatermarkStore:
+    # puuid -> queue -> newest ingested match and the latest match IDs known for
+    # that queue, so the next run only asks the API for newer matches.
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.state: Dict[str, Dict[str, Dict[str, Any]]] = (
+            read_json(path) if os.path.exists(path) else {}
+        )
+        self._dirty = False
+
+    def get(self, puuid: str, queue: int) -> Dict[str, Any] | None:
+        return self.state.get(puuid, {}).get(str(queue))
+
+    def update(
+        self, puuid: str, queue: int, match_ids: List[str], game_start: int
+    ) -> None:
+        # match_ids are newest first; game_start is the start of match_ids[0].
+        if not match_ids:
+            return
+        current = self.get(puuid, queue)
+        if current is not None and current["game_start"] > game_start:
+            return
+        self.state.setdefault(puuid, {})[str(queue)] = {
+            "game_start": game_start,
+            "match_id": match_ids[0],
+            "match_ids": match_ids,
+        }
+        self._dirty = True
+
+    def save(self) -> None:
+        if self._dirty:
+            write_json(self.path, self.state)
+            self._dirty = False